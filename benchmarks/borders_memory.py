@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import fit
+
+FILTERS = ['Static strain', 'Full range', 'Top bottom', 'Sectioned best', 'Best window']
+
+
+# traced memory of the border filters returning offsets into the column buffers against the former ones copying
+# every chunk into a new DataFrame. Run with "python benchmarks/borders_memory.py" from the repository root
+def old_calc_borders(range_filter, down, chunk):
+    # the former implementation, a deep copy per chunk and a second one for 'Full range'
+    df_range = chunk.copy(deep=True)
+    range_type = range_filter['type']
+
+    if range_type == 'Static strain':
+        df_range['Travel subtracted'] = abs(df_range['Standard travel'] - df_range.iloc[0, 2])
+        df_start_end = df_range[(df_range['Travel subtracted'] > range_filter['lower_strain']) &
+                                (df_range['Travel subtracted'] < range_filter['upper_strain'])]
+    elif range_type == 'Full range':
+        df_start_end = df_range.copy(deep=True)
+    elif range_type == 'Top bottom':
+        top = df_range['Standard stress'].max()
+        bottom = df_range['Standard stress'].min()
+        cutoff = (top - bottom) * (range_filter['rel_cutoff_pct'] / 100)
+        df_start_end = df_range[(df_range['Standard stress'] > bottom + cutoff) &
+                                (df_range['Standard stress'] < top - cutoff)]
+    elif range_type == 'Sectioned best':
+        section_size = len(chunk) // range_filter['no_sections']
+        stride = max(section_size * range_filter['section_stride_pct'] // 100, 1)
+        n_sections = len(chunk) // section_size if section_size > 0 else 0
+        if down == 0:
+            lower, upper = 0, (n_sections // 2) * section_size
+        else:
+            lower, upper = (n_sections // 2 + 1) * section_size, n_sections * section_size
+        starts = np.arange(lower, upper - section_size + 1, stride, dtype=np.int64)
+        r2 = fit.window_r2(df_range['Standard travel'].values, df_range['Standard stress'].values, section_size,
+                           starts)
+        scores = np.where(np.isnan(r2), 0, r2)
+        df_start_end = df_range.iloc[0:0]
+        if len(scores) > 0 and scores.max() > 0:
+            best = starts[np.argmax(scores)]
+            df_start_end = df_range.iloc[best:best + section_size]
+    elif range_type == 'Best window':
+        start, stop = fit.best_window(df_range['Standard travel'].values, df_range['Standard stress'].values,
+                                      range_filter['window_min_samples'], range_filter['window_min_strain'],
+                                      range_filter['window_criterion'])
+        df_start_end = df_range.iloc[start:stop]
+    else:
+        raise ValueError(f'Input "{range_filter}" was not recognized.')
+
+    return df_start_end
+
+
+def old_borders(cycles, range_filter):
+    borders = []
+    for n in range(len(cycles.start)):
+        chunk = cycles.chunk(n)
+        df_start_end = old_calc_borders(range_filter, int(cycles.direction[n] < 0), chunk)
+
+        # linear copied the chunk a third time if the filter erased everything
+        if df_start_end.empty:
+            df_start_end = chunk.copy(deep=True)
+        borders.append((chunk.index.get_loc(df_start_end.index[0]), chunk.index.get_loc(df_start_end.index[-1]) + 1))
+    return borders
+
+
+def new_borders(cycles, range_filter):
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+    borders = []
+    for n in range(len(cycles.start)):
+        start, stop = fit.calc_borders(range_filter, int(cycles.direction[n] < 0),
+                                       travel[cycles.start[n]:cycles.stop[n]], stress[cycles.start[n]:cycles.stop[n]])
+        if stop <= start:
+            start, stop = 0, cycles.lengths[n]
+        borders.append((start, stop))
+    return borders
+
+
+def measure(function, *args):
+    # wall time of an untraced run, then the traced peak of a second one, the column buffers are allocated before
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the traced memory of the border filters.')
+    parser.add_argument('--cycles', type=int, default=20, help='number of cycles, default: %(default)s')
+    parser.add_argument('--half', type=int, default=100000, help='samples per half cycle, default: %(default)s')
+    parser.add_argument('--filters', default=','.join(FILTERS), help='comma separated range filters')
+    args = parser.parse_args(argv)
+
+    df, cycles = synthetic.cycle_table(args.cycles, half=args.half)
+    chunk_mb = args.half * df.shape[1] * 8 / 1e6
+    print(f'{len(cycles.start)} chunks of {args.half} samples, {chunk_mb:.1f} MB per chunk frame')
+    print(f'{"filter":>15s} {"old s":>7s} {"new s":>7s} {"old peak MB":>12s} {"new peak MB":>12s} {"ratio":>7s}  '
+          f'equal')
+
+    failed = False
+    for range_type in [value.strip() for value in args.filters.split(',') if value.strip()]:
+        range_filter = synthetic.range_filter(range_type)
+        old_time, old_peak, expected = measure(old_borders, cycles, range_filter)
+        new_time, new_peak, found = measure(new_borders, cycles, range_filter)
+
+        equal = expected == [(int(start), int(stop)) for start, stop in found]
+        print(f'{range_type:>15s} {old_time:7.2f} {new_time:7.2f} {old_peak / 1e6:12.2f} {new_peak / 1e6:12.2f} '
+              f'{old_peak / max(new_peak, 1):6.1f}x  {"ok" if equal else "MISMATCH"}')
+        failed |= not equal
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import io_data
+
+
+# throughput of io_data.load_data on compressed exports against the uncompressed file, in MB of text per second.
+# The DataFrame must not hold a larger column buffer than its rows, however far the fixed compression ratio is off.
+# Run with "python benchmarks/compressed.py" from the repository root
+def compress(path_to_file, extension):
+    compressed = path_to_file + extension
+    with open(path_to_file, 'rb') as input_file, io_data.OPENERS[extension](compressed, 'wb') as output_file:
+        shutil.copyfileobj(input_file, output_file, io_data.CHUNK_BYTES)
+    return compressed
+
+
+def best_time(path_to_file, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        df, meta = io_data.load_data(path_to_file)
+        times.append(time.perf_counter() - start)
+    return min(times), df.values, held_rows(df)
+
+
+def held_rows(df):
+    # rows of the buffer behind the DataFrame block, the frame is a view on it and keeps all of it alive
+    values = df._data.blocks[0].values
+    while values.base is not None:
+        values = values.base
+    return values.size // df.shape[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark loading compressed against uncompressed exports.')
+    parser.add_argument('--rows', type=synthetic.parse_counts, default=[1000000],
+                        help='comma separated row counts, default: %(default)s')
+    parser.add_argument('--formats', default='.gz,.bz2,.xz', help='compressed formats, default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per file, default: %(default)s')
+    parser.add_argument('--folder', default=None, help='folder for the generated files, defaults to a temporary one')
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+        print(f'{"rows":>10s} {"format":>6s} {"MB":>8s} {"ratio":>6s} {"s":>7s} {"MB/s":>7s} {"vs .txt":>8s} '
+              f'{"held rows":>10s}  equal')
+        for n_rows in args.rows:
+            path_to_file = os.path.join(folder, f'export_{n_rows}.txt')
+            synthetic.write_export(path_to_file, n_rows)
+            size = os.stat(path_to_file).st_size
+
+            # the text size is the reference for every format, the throughput counts decompressed bytes
+            reference_time, reference, held = best_time(path_to_file, args.repeat)
+            print(f'{n_rows:10d} {".txt":>6s} {size / 1e6:8.1f} {1:6.1f} {reference_time:7.2f} '
+                  f'{size / 1e6 / reference_time:7.1f} {1:7.2f}x '
+                  f'{held:10d}  {"ok" if held == n_rows else "MISMATCH"}')
+            failed |= held != n_rows
+
+            for extension in [value.strip() for value in args.formats.split(',') if value.strip()]:
+                compressed = compress(path_to_file, extension)
+                ratio = size / os.stat(compressed).st_size
+                elapsed, values, held = best_time(compressed, args.repeat)
+                equal = np.array_equal(reference, values) and held == n_rows
+                os.remove(compressed)
+
+                print(f'{n_rows:10d} {extension:>6s} {size / 1e6:8.1f} {ratio:6.1f} '
+                      f'{elapsed:7.2f} {size / 1e6 / elapsed:7.1f} {elapsed / reference_time:7.2f}x '
+                      f'{held:10d}  {"ok" if equal else "MISMATCH"}')
+                failed |= not equal
+
+            os.remove(path_to_file)
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import fit
+
+
+# scaling of the fitting stage over the executors of fit.linear and the number of workers, every result is compared
+# to the serial one. Run with "python benchmarks/executors.py" from the repository root
+def parse_workers(text):
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the executors of fit.linear.')
+    parser.add_argument('--cycles', type=int, default=5000, help='number of cycles, default: %(default)s')
+    parser.add_argument('--filters', default='Sectioned best,Best window',
+                        help='comma separated range filters, default: %(default)s')
+    parser.add_argument('--workers', type=parse_workers, default=[1, 4, 16, 32],
+                        help='comma separated worker counts, default: %(default)s')
+    args = parser.parse_args(argv)
+
+    df, cycles = synthetic.cycle_table(args.cycles)
+    print(f'{len(cycles)} cycles on {os.cpu_count()} CPUs, batches of {fit.BATCH_SIZE} chunks')
+    print(f'{"filter":>15s} {"executor":>10s} {"workers":>8s} {"s":>8s} {"speedup":>8s}  equal')
+
+    failed = False
+    for range_type in [value.strip() for value in args.filters.split(',') if value.strip()]:
+        range_filter = synthetic.range_filter(range_type)
+
+        start = time.perf_counter()
+        reference = fit.linear(df, cycles, range_filter, executor='serial')
+        serial_time = time.perf_counter() - start
+        print(f'{range_type:>15s} {"serial":>10s} {1:8d} {serial_time:8.2f} {1:7.2f}x')
+
+        for executor in ['threads', 'processes']:
+            for workers in args.workers:
+                start = time.perf_counter()
+                d = fit.linear(df, cycles, range_filter, executor=executor, workers=workers)
+                elapsed = time.perf_counter() - start
+
+                # the executors only spread the border calculation, the results are identical
+                equal = all(d[key].equals(reference[key]) for key in reference)
+                print(f'{range_type:>15s} {executor:>10s} {workers:8d} {elapsed:8.2f} {serial_time / elapsed:7.2f}x  '
+                      f'{"ok" if equal else "MISMATCH"}')
+                failed |= not equal
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import fit
+
+
+# closed-form batch fitting of fit.linear against one sklearn LinearRegression per chunk, the former engine. Both
+# use the same fit borders, so only the fitting itself differs. Run with "python benchmarks/fitting.py" from the
+# repository root
+def sklearn_linear(cycles, range_filter):
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import r2_score
+
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+    rows = []
+    for group_id in range(len(cycles)):
+        for down, n in enumerate(cycles.halves[group_id]):
+            if n < 0:
+                continue
+            chunk = cycles.chunk(n)
+            start, stop = fit.calc_borders(fit.resolve_filter(range_filter, group_id, down, len(cycles)), down,
+                                           travel[cycles.start[n]:cycles.stop[n]],
+                                           stress[cycles.start[n]:cycles.stop[n]])
+            if stop <= start:
+                start, stop = 0, len(chunk)
+
+            # build and evaluate one model per chunk like the former fit.linear
+            x = chunk[['Standard travel']].iloc[start:stop]
+            y = chunk[['Standard stress']].iloc[start:stop]
+            model = LinearRegression()
+            model.fit(x, y)
+            fit_y = model.predict(x)
+            rows.append((group_id + 1, cycles.direction[n] > 0, r2_score(y, fit_y), model.coef_.flat[0] / 10,
+                         model.intercept_.flat[0]))
+
+    params = pd.DataFrame(rows, columns=['Cycle', 'up', 'r2', 'E', 't'])
+    return {'loading': params[params['up']].reset_index(drop=True),
+            'unloading': params[~params['up']].reset_index(drop=True)}
+
+
+def max_difference(d, reference):
+    # relative to the largest value of every column, intercepts close to zero would inflate a per-value ratio
+    return max(float(np.max(np.abs(d[key][column].values - reference[key][column].values)) /
+                     np.max(np.abs(reference[key][column].values)))
+               for key in ['loading', 'unloading'] for column in ['r2', 'E', 't'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the batched linear fits against one sklearn model per '
+                                                 'chunk.')
+    parser.add_argument('--cycles', type=synthetic.parse_counts, default=[1000, 10000],
+                        help='comma separated cycle counts, default: %(default)s')
+    parser.add_argument('--filter', default='Static strain', help='range filter, default: %(default)s')
+    args = parser.parse_args(argv)
+
+    range_filter = synthetic.range_filter(args.filter)
+    failed = False
+    print(f'{"cycles":>8s} {"chunks":>8s} {"sklearn s":>10s} {"batched s":>10s} {"speedup":>8s} '
+          f'{"max rel. diff":>14s}')
+    for n_cycles in args.cycles:
+        df, cycles = synthetic.cycle_table(n_cycles)
+
+        start = time.perf_counter()
+        reference = sklearn_linear(cycles, range_filter)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        d = fit.linear(df, cycles, range_filter)
+        new_time = time.perf_counter() - start
+
+        difference = max_difference(d, reference)
+        print(f'{n_cycles:8d} {len(d["loading"]) + len(d["unloading"]):8d} {old_time:10.2f} {new_time:10.3f} '
+              f'{old_time / new_time:7.0f}x {difference:14.1e}')
+        failed |= not difference < 1e-9
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import hysteresis
+
+
+# batched loop integration of hysteresis.calc against the former loop over the cycles with two rolling means, a
+# concat and three trapz calls per cycle. Run with "python benchmarks/hysteresis.py" from the repository root
+def loop_calc(cycles, smoothing=16):
+    from scipy.integrate import trapz
+
+    hyst_integrals = {}
+    E_loading = {}
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+
+    for nr in cycles.complete() + 1:
+        group = cycles.group(nr - 1)
+        loading = group[0].rolling(window=smoothing, center=True).mean().dropna()
+        unloading = group[1].rolling(window=smoothing, center=True).mean().dropna()
+        additional = pd.concat([loading.iloc[[0]], unloading.iloc[[-1]]])
+
+        loading_integral = trapz(loading['Standard stress'], x=loading['Standard travel'])
+        unloading_integral = trapz(unloading['Standard stress'], x=unloading['Standard travel'])
+        additional_integral = trapz(additional['Standard stress'], x=additional['Standard travel'])
+
+        first, last = cycles.start[cycles.halves[nr - 1, 0]], cycles.stop[cycles.halves[nr - 1, 0]] - 1
+        hyst_integrals[str(nr)] = [loading_integral + unloading_integral - additional_integral]
+        E_loading[str(nr)] = ((stress[last] - stress[first]) / (travel[last] - travel[first])) / 10
+
+    return {'areas': hyst_integrals, 'E_loading': E_loading}
+
+
+def max_difference(results, reference):
+    # relative to the largest magnitude, the areas change sign around zero
+    differences = []
+    for key in ['areas', 'E_loading']:
+        expected = np.array([np.ravel(value)[0] for value in reference[key].values()])
+        found = np.array([np.ravel(results[key][nr])[0] for nr in reference[key]])
+        differences.append(np.max(np.abs(found - expected)) / np.max(np.abs(expected)))
+    return float(max(differences))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the batched hysteresis integration against the former '
+                                                 'loop over the cycles.')
+    parser.add_argument('--cycles', type=synthetic.parse_counts, default=[1000, 10000, 100000],
+                        help='comma separated cycle counts, default: %(default)s')
+    parser.add_argument('--loop-max', type=int, default=10000,
+                        help='largest cycle count the former loop is run for, default: %(default)s')
+    parser.add_argument('--smoothing', type=int, default=16, help='rolling mean window, default: %(default)s')
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f'{"cycles":>8s} {"loop s":>8s} {"batched s":>10s} {"speedup":>8s} {"max rel. diff":>14s}')
+    for n_cycles in args.cycles:
+        df, cycles = synthetic.cycle_table(n_cycles)
+
+        start = time.perf_counter()
+        results = hysteresis.calc(cycles, smoothing=args.smoothing)
+        new_time = time.perf_counter() - start
+
+        if n_cycles > args.loop_max:
+            print(f'{n_cycles:8d} {"-":>8s} {new_time:10.3f}')
+            continue
+
+        start = time.perf_counter()
+        reference = loop_calc(cycles, smoothing=args.smoothing)
+        old_time = time.perf_counter() - start
+
+        equal = sorted(results['areas']) == sorted(reference['areas'])
+        difference = max_difference(results, reference) if equal else np.inf
+        print(f'{n_cycles:8d} {old_time:8.2f} {new_time:10.3f} {old_time / new_time:7.0f}x {difference:14.1e}')
+        failed |= not difference < 1e-9
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+# modules the compute path must not load on import, they are imported by the first call needing them
+HEAVY = ['scipy', 'matplotlib', 'sklearn']
+
+
+# import time of the compute modules in a fresh interpreter. Run with "python benchmarks/imports.py" from the
+# repository root, exits with 1 if one of the heavy modules got imported
+def main():
+    start = time.perf_counter()
+    from src import preprocessing, fit, hysteresis
+    elapsed = time.perf_counter() - start
+    print(f'from src import preprocessing, fit, hysteresis: {elapsed * 1000:.0f} ms')
+
+    loaded = sorted({name.split('.')[0] for name in sys.modules} & set(HEAVY))
+    if loaded:
+        print(f'imported on import: {", ".join(loaded)}')
+        return 1
+    print(f'none of {", ".join(HEAVY)} imported')
+    return 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import argparse
+import gc
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import io_data
+
+
+# single-pass streaming loader against the former two-pass load_data, time and peak traced memory per row count.
+# Run with "python benchmarks/load.py" from the repository root, 1e8 rows need about 8 GB of disk
+def old_load_data(path_to_file):
+    # the former implementation: readlines() of the whole file for the header, then a second read by pd.read_csv
+    with open(path_to_file, 'r') as input_file:
+        content = input_file.readlines()
+        metadata = ''.join(content[:3]).replace('\"', '')
+        units = ''.join(content[3:5]).replace('\"', '')
+
+    metadata = re.split('[\t\n]', metadata)
+    units = re.split('[\t\n]', units)
+    meta = {metadata[0]: metadata[1],
+            metadata[2]: ' '.join(metadata[3:5]),
+            metadata[5]: ' '.join(metadata[6:8])}
+
+    df = pd.read_csv(path_to_file, sep='\t',
+                     header=0, names=[units[i] for i in range(0, 4)],
+                     skiprows=4, index_col=False,
+                     decimal=',')
+    return df, meta
+
+
+def measure(function, repeat):
+    # best wall time of repeat runs, then the traced peak of one more run
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark io_data.load_data against the former two-pass loader.')
+    parser.add_argument('--rows', type=synthetic.parse_counts, default=[100000, 1000000],
+                        help='comma separated row counts, e.g. 1e5,1e6,1e7,1e8, default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per loader, default: %(default)s')
+    parser.add_argument('--folder', default=None, help='folder for the generated files, defaults to a temporary one')
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+        print(f'{"rows":>10s} {"MB":>8s} {"old s":>8s} {"new s":>8s} {"speedup":>8s} '
+              f'{"old peak MB":>12s} {"new peak MB":>12s}  equal')
+        for n_rows in args.rows:
+            path_to_file = os.path.join(folder, f'export_{n_rows}.txt')
+            synthetic.write_export(path_to_file, n_rows)
+            size = os.stat(path_to_file).st_size / 1e6
+
+            repeat = 1 if n_rows >= 10000000 else args.repeat
+            old_time, old_peak, (df_old, meta_old) = measure(lambda: old_load_data(path_to_file), repeat)
+            values_old = df_old.values.astype(np.float64)
+            del df_old
+            new_time, new_peak, (df_new, meta_new) = measure(lambda: io_data.load_data(path_to_file), repeat)
+
+            equal = meta_new == dict(meta_old, columns=meta_new['columns']) and \
+                np.array_equal(values_old, df_new.values)
+            del values_old, df_new
+            os.remove(path_to_file)
+
+            print(f'{n_rows:10d} {size:8.1f} {old_time:8.2f} {new_time:8.2f} {old_time / new_time:7.1f}x '
+                  f'{old_peak / 1e6:12.1f} {new_peak / 1e6:12.1f}  {"ok" if equal else "MISMATCH"}')
+            failed |= not equal
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import io_data
+
+
+# body parser of the fixed float layout against the general parser it falls back to, both on the same body in
+# memory so that only the parsing is timed. Run with "python benchmarks/parse.py" from the repository root
+def general_parse(block, n_columns):
+    # the general parser of io_data.parse_block
+    df_block = pd.read_csv(io.BytesIO(block), sep='\t',
+                           header=None, names=list(range(n_columns)),
+                           index_col=False, decimal=',')
+    return df_block.values.astype(np.float64)
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the fixed-layout body parser against the general one.')
+    parser.add_argument('--rows', type=synthetic.parse_counts, default=[100000, 1000000],
+                        help='comma separated row counts, default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per parser, default: %(default)s')
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f'{"rows":>10s} {"MB":>8s} {"general s":>10s} {"fixed s":>8s} {"speedup":>8s}  equal')
+    for n_rows in args.rows:
+        df = synthetic.export_frame(n_rows)
+        with io.StringIO() as text:
+            df.to_csv(text, sep='\t', header=False, index=False, decimal=',')
+            body = text.getvalue().encode(io_data.ENCODING)
+        del df
+
+        general_time, expected = best_time(lambda: general_parse(body, 4), args.repeat)
+        fixed_time, found = best_time(lambda: io_data.parse_block_fixed(body, 4), args.repeat)
+
+        equal = np.array_equal(expected, found)
+        print(f'{n_rows:10d} {len(body) / 1e6:8.1f} {general_time:10.3f} {fixed_time:8.3f} '
+              f'{general_time / fixed_time:7.2f}x  {"ok" if equal else "MISMATCH"}')
+        failed |= not equal
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
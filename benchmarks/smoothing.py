@@ -0,0 +1,108 @@
+import argparse
+import gc
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from benchmarks import synthetic
+from src import analysis_settings, filters, preprocessing
+
+
+# single-channel smoothing of detect_peaks against the former rolling mean over the whole DataFrame. The moving average
+# has to match it bit for bit, the detected peaks are compared on strain rounded like quantized measurements, where
+# a rounding difference decides ties. Run with "python benchmarks/smoothing.py" from the repository root, the frame at
+# 1e8 samples needs about 8 GB of memory
+def old_detect_peaks(df, smoothing, distance, width):
+    # the former detect_peaks without the pre-loading split, a rolling mean over the whole DataFrame
+    import scipy.signal as signal
+
+    travel = df.rolling(window=smoothing, center=True).mean()['Standard travel'].values
+    hills = signal.find_peaks(travel, distance=distance, width=width)[0]
+    valleys = signal.find_peaks(np.negative(travel), distance=distance, width=width)[0]
+    return hills, valleys
+
+
+def moved_peaks(df, smoothing, distance, width):
+    # hills and valleys of detect_peaks not found at the sample of the former implementation
+    with warnings.catch_warnings():
+        # flat peaks of the rounded strain have a width of 0 in both implementations
+        warnings.simplefilter('ignore')
+        expected = old_detect_peaks(df, smoothing, distance, width)
+        found = preprocessing.detect_peaks(df, smoothing, distance, width, False, 0)[1:3]
+    return [len(np.setxor1d(old, new.values)) for old, new in zip(expected, found)]
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+        del result
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the smoothing kernels against DataFrame.rolling.')
+    parser.add_argument('--samples', type=synthetic.parse_counts, default=[1000000, 10000000],
+                        help='comma separated sample counts, e.g. 1e6,1e7,1e8, default: %(default)s')
+    parser.add_argument('--window', type=int, default=15, help='smoothing window, default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per kernel, default: %(default)s')
+    parser.add_argument('--decimals', type=synthetic.parse_counts, default=[3, 4, 5],
+                        help='comma separated decimals the strain is rounded to for the peaks, default: %(default)s')
+    args = parser.parse_args(argv)
+
+    prepare = analysis_settings.prepare_kwargs(analysis_settings.defaults())
+    failed = False
+    print(f'{"samples":>10s} {"kernel":>28s} {"s":>8s} {"vs frame":>9s}')
+    for n_samples in args.samples:
+        df = synthetic.export_frame(n_samples)
+        df['Standard stress'] = df['Standard force'] / 13
+        travel = df['Standard travel'].values
+        repeat = 1 if n_samples >= 100000000 else args.repeat
+
+        # the former detect_peaks smoothed every column although only the strain is used
+        reference = best_time(lambda: df.rolling(window=args.window, center=True).mean(), repeat)
+        expected = df['Standard travel'].rolling(window=args.window, center=True).mean().values
+        del df
+        print(f'{n_samples:10d} {"DataFrame.rolling (5 columns)":>28s} {reference:8.3f} {1:8.1f}x')
+
+        kernels = [('Series.rolling (1 column)', lambda: pd.Series(travel).rolling(window=args.window,
+                                                                                    center=True).mean()),
+                   ('moving_average', lambda: filters.moving_average(travel, args.window)),
+                   ('savgol', lambda: filters.savgol(travel, args.window)),
+                   ('filtfilt', lambda: filters.filtfilt(travel, args.window))]
+        for name, kernel in kernels:
+            elapsed = best_time(kernel, repeat)
+            print(f'{n_samples:10d} {name:>28s} {elapsed:8.3f} {reference / elapsed:8.1f}x')
+
+        # the moving average replaces the rolling mean, same NaN borders and the same values bit for bit
+        smooth = filters.moving_average(travel, args.window)
+        valid = ~np.isnan(expected)
+        equal = np.array_equal(np.isnan(smooth), ~valid) and np.array_equal(smooth[valid], expected[valid])
+        print(f'{n_samples:10d} {"moving_average vs rolling":>28s} {"ok" if equal else "MISMATCH":>8s}')
+        failed |= not equal
+
+        for decimals in args.decimals:
+            df = synthetic.export_frame(n_samples).round({'Standard travel': decimals})
+            df['Standard stress'] = df['Standard force'] / 13
+            hills, valleys = moved_peaks(df, args.window, prepare['distance'], prepare['width'])
+            del df
+            print(f'{n_samples:10d} {f"moved peaks, {decimals} decimals":>28s} {hills:8d} hills {valleys:8d} valleys  '
+                  f'{"ok" if hills == valleys == 0 else "MISMATCH"}')
+            failed |= hills != 0 or valleys != 0
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
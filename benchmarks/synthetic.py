@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+HEADER = ['"Specimen designation"\t"S-01"', '"Test date"\t"01.02.2020"\t"12:00"', '"Width"\t"1,3"\t"mm"',
+          '"Test time"\t"Standard force"\t"Standard travel"\t"Strain"', '"s"\t"N"\t"%"\t"mm"']
+
+
+# synthetic testing machine exports for the benchmarks, triangular strain cycles of growing amplitude with noise
+def export_frame(n_rows, period=200, seed=0, start=0, total=None):
+    # rows [start, start + n_rows) of an export with total rows
+    total = start + n_rows if total is None else total
+    rng = np.random.default_rng(seed + start)
+    t = np.arange(start, start + n_rows, dtype=np.float64)
+    position = (t / period) % 1
+    travel = (0.1 + 0.3 * t / max(total, 1)) * np.where(position < 0.5, 2 * position, 2 - 2 * position)
+    travel += rng.normal(0, 1e-3, n_rows)
+    force = 26000 * travel + 400 * np.sin(2 * np.pi * position) + rng.normal(0, 1, n_rows)
+    return pd.DataFrame({'Test time': t / 100, 'Standard force': force, 'Standard travel': travel,
+                         'Strain': travel * 0.5})
+
+
+def write_export(path_to_file, n_rows, period=200, seed=0, rows_per_block=1000000):
+    # tab separated with a decimal comma and full float precision, written block-wise to bound the memory
+    with open(path_to_file, 'w', newline='') as output_file:
+        output_file.write('\n'.join(HEADER) + '\n')
+        for start in range(0, n_rows, rows_per_block):
+            df = export_frame(min(rows_per_block, n_rows - start), period, seed, start, n_rows)
+            df.to_csv(output_file, sep='\t', header=False, index=False, decimal=',')
+
+
+def parse_counts(text):
+    # comma separated counts, '1e6' is accepted for 1000000
+    return [int(float(value)) for value in text.split(',') if value.strip()]
+
+
+def cycle_table(n_cycles, half=60, seed=0):
+    # n_cycles triangular cycles of 2 * half samples with stress already calculated, split at every peak like
+    # preprocessing.groupify does. Starts on a valley, so chunk 0 is a lone loading half
+    from src import preprocessing
+
+    rng = np.random.default_rng(seed)
+    n = 2 * half * n_cycles
+    position = (np.arange(n) % (2 * half)) / half
+    travel = np.where(position < 1, position, 2 - position) * 0.3 + rng.normal(0, 1e-3, n)
+    stress = travel * 1000 + np.where(position < 1, 0, -5) + rng.normal(0, 0.5, n)
+    df = pd.DataFrame({'Test time': np.arange(n) / 100, 'Standard force': stress * 13, 'Standard travel': travel,
+                       'Strain': travel * 0.5, 'Standard stress': stress})
+    columns = {column: df[column].values for column in df.columns}
+    cycles = preprocessing.CycleTable.from_peaks(columns, np.arange(half, n, half), n, False, frame=df)
+    return df, cycles
+
+
+def range_filter(range_type):
+    # the default fit settings with another range filter
+    from src import analysis_settings
+
+    return analysis_settings.range_filter(dict(analysis_settings.defaults(), range_filter=range_type))
@@ -6,6 +6,10 @@ from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.popup import Popup
 from kivy.uix.settings import SettingsWithSidebar
 
+import functools
+import matplotlib
+# backend selection belongs to the application, the analysis modules stay importable without a GUI stack
+matplotlib.use('Qt5Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -16,7 +20,7 @@ import os
 import sys
 sys.path.extend([os.getcwd()])
 
-from src import fit, hysteresis, io_data, preprocessing, kivy_classes
+from src import analysis_settings, downsample, fit, hysteresis, io_data, pipeline, preprocessing, kivy_classes
 
 kivy.require('1.11.1')
 Window.maximize()
@@ -33,9 +37,15 @@ class CTAnalyzer(App):
         self.df_prepro = pd.DataFrame()
         self.meta_data, self.dict_prepro, self.master_results, self.fit_results, self.parameters = {}, {}, {}, {}, {}
         self.hyst_results = []
+        self.rainflow_results = {}
+        self.phase_results = {}
 
-        # figure storage
+        # memoized evaluation stages of the loaded file, a settings change only recomputes the stages reading it
+        self.pipeline = None
+
+        # figure storage, figures are only built from their plotter when they are shown or saved
         self.figures = {}
+        self.plotters = {}
 
         # kivy screen management
         self.screen_manager = ScreenManager()
@@ -49,29 +59,15 @@ class CTAnalyzer(App):
 
     def build_config(self, config):
         # settings at first startup, overridden by ctanalyzer.ini if existing
-        self.config.setdefaults('Analysis Settings',
-                                {'split_peaks': 0,
-                                 'filter_value': 0.005,
-                                 'is_percent': 1,
-                                 'output_path': os.path.join(os.getcwd(), 'results'),
-                                 'x_dimensions': 1.3,
-                                 'y_dimensions': 10.0,
-                                 'factor': 100,
-                                 'smoothing_pre': 15,
-                                 'peak_distance': 5,
-                                 'peak_width': 5,
-                                 'range_filter': 'Static strain',
-                                 'upper_strain': 0.25,
-                                 'lower_strain': 0.05,
-                                 'rel_cutoff_pct': 25,
-                                 'no_sections': 5,
-                                 'smoothing_dynamic': 35,
-                                 'dynamic_line_divisor': 5,
-                                 'smoothing_hyst': 16})
+        self.config.setdefaults('Analysis Settings', analysis_settings.defaults())
 
     def build_settings(self, settings):
         settings.add_json_panel('Analysis Settings', self.config, 'settings.json')
 
+    def settings_values(self):
+        # all analysis settings as strings, converted by the pipeline stages like by the batch CLI
+        return {key: self.config.get('Analysis Settings', key) for key in analysis_settings.defaults()}
+
     def open_for_load(self):
         # create input folder if not existing
         input_path = os.path.join(self.cwd, 'input')
@@ -86,18 +82,19 @@ class CTAnalyzer(App):
     def call_load(self, caller, filepath, event):
         self.page_load_browser.dismiss()
 
-        # check if input is TXT or csv
-        if not filepath[0].lower().endswith('.txt') and not filepath[0].lower().endswith('.csv'):
-            ctanalyzer.page_main.update_console('ERROR: Please provide a .csv or .txt file')
+        # check if input is TXT or csv, compressed files are decompressed while loading
+        filename = io_data.strip_compression(filepath[0].lower())
+        if not filename.endswith('.txt') and not filename.endswith('.csv'):
+            ctanalyzer.page_main.update_console('ERROR: Please provide a .csv or .txt file (optionally .gz/.bz2/.xz)')
             return
 
-        # flush all plots (avoid memory issues); catch and convert from settings
+        # flush all plots (avoid memory issues)
         plt.close('all')
-        is_percent = True if ctanalyzer.get_running_app().config.get('Analysis Settings', 'is_percent') == '1' \
-            else False
 
-        self.df, self.meta_data = io_data.load_data(filepath[0],
-                                                    is_percent=is_percent)
+        # loading honours the cache settings, a new file starts a new pipeline
+        values = self.settings_values()
+        self.pipeline = pipeline.Pipeline(filepath[0])
+        self.df, self.meta_data = self.pipeline.run('load', values)
 
         # check for required fields
         if 'Specimen designation' not in self.meta_data or self.df.empty:
@@ -107,123 +104,85 @@ class CTAnalyzer(App):
 
         self.page_main.specimen_designation.text = self.meta_data['Specimen designation']
 
-        # plotting
+        # plotting, every curve is reduced to the resolution of the canvas
         figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
+        decimation = self.decimation()
 
         fig = plt.figure(figsize=figsize)
         axs = fig.subplots(2, 2)
         fig.suptitle(self.meta_data['Specimen designation'])
 
-        axs[0, 0].plot(self.df['Test time'], self.df['Standard force'], color='dimgrey')
+        downsample.plot(axs[0, 0], self.df['Test time'], self.df['Standard force'], decimation['max_points'],
+                        decimation['decimation'], color='dimgrey')
         axs[0, 0].set_xlabel('Time [s]')
         axs[0, 0].set_ylabel('Force [N]')
 
-        axs[0, 1].plot(self.df['Test time'], self.df['Standard travel'], color='dimgrey')
+        downsample.plot(axs[0, 1], self.df['Test time'], self.df['Standard travel'], decimation['max_points'],
+                        decimation['decimation'], color='dimgrey')
         axs[0, 1].set_xlabel('Time [s]')
         axs[0, 1].set_ylabel('Strain [%]')
 
-        axs[1, 0].plot(self.df['Standard travel'], self.df['Standard force'], color='dimgrey')
+        downsample.plot(axs[1, 0], self.df['Standard travel'], self.df['Standard force'], decimation['max_points'],
+                        decimation['decimation'], color='dimgrey')
         axs[1, 0].set_xlabel('Strain [%]')
         axs[1, 0].set_ylabel('Force [N]')
 
-        axs[1, 1].plot(self.df['Test time'], self.df['Strain'], color='dimgrey')
+        downsample.plot(axs[1, 1], self.df['Test time'], self.df['Strain'], decimation['max_points'],
+                        decimation['decimation'], color='dimgrey')
         axs[1, 1].set_xlabel('Time [s]')
         axs[1, 1].set_ylabel('Strain [mm]')
 
         # save parameter and update UI
-        self.parameters['is_percent'] = is_percent
+        self.parameters['is_percent'] = analysis_settings.as_bool(values['is_percent'])
         ctanalyzer.page_main.update_console(f'Read in file: {filepath[0]}')
         ctanalyzer.page_main.update_graphx(fig)
 
-    def call_prepare(self):
-        # flush previous, check if data was preprocessed
-        if 'prepare' in self.figures:
-            plt.close(self.figures['prepare'])
+    def call_prepare(self, show=True):
+        # flush previous unless its stage is unchanged, check if data was loaded
+        self.flush_stale('groupify', 'prepare')
         if self.df.empty:
             ctanalyzer.page_main.update_console('ERROR: Please load in a file first')
             return
 
-        # catch and convert from settings
-        split_peaks = True if ctanalyzer.get_running_app().config.get('Analysis Settings', 'split_peaks') == '1' \
-            else False
-        filter_value = ctanalyzer.get_running_app().config.get('Analysis Settings', 'filter_value')
-        x_dimensions = ctanalyzer.get_running_app().config.get('Analysis Settings', 'x_dimensions')
-        y_dimensions = ctanalyzer.get_running_app().config.get('Analysis Settings', 'y_dimensions')
-        factor = ctanalyzer.get_running_app().config.get('Analysis Settings', 'factor')
-        smoothing = ctanalyzer.get_running_app().config.get('Analysis Settings', 'smoothing_pre')
-        distance = ctanalyzer.get_running_app().config.get('Analysis Settings', 'peak_distance')
-        width = ctanalyzer.get_running_app().config.get('Analysis Settings', 'peak_width')
-
-        figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
-        self.df_prepro, self.dict_prepro, self.figures['prepare'] = \
-            preprocessing.prepare(self.df, figsize=figsize,
-                                  split_peaks=split_peaks,
-                                  filter_value=float(filter_value),
-                                  x_dimensions=float(x_dimensions),
-                                  y_dimensions=float(y_dimensions),
-                                  factor=int(factor),
-                                  smoothing=int(smoothing),
-                                  distance=int(distance),
-                                  width=int(width))
+        # stress, cut_end, detect_peaks and groupify are only recomputed if a setting they read changed
+        values = self.settings_values()
+        self.df_prepro, self.dict_prepro = self.pipeline.run('groupify', values)
 
-        # save parameter and update UI
-        self.parameters['split_peaks'] = split_peaks
-        self.parameters['filter_value'] = filter_value
-        self.parameters['x_dimensions'] = x_dimensions
-        self.parameters['y_dimensions'] = y_dimensions
-        self.parameters['factor'] = factor
-        self.parameters['smoothing_pre'] = smoothing
-        self.parameters['distance'] = distance
-        self.parameters['width'] = width
+        # save parameter, converted like by the pipeline stages, and update UI
+        self.parameters.update(analysis_settings.prepare_kwargs(values))
+        self.plotters['prepare'] = functools.partial(preprocessing.plot_prepare, self.df_prepro, self.dict_prepro)
         ctanalyzer.page_main.update_console('Preprocessing exited without errors, plotting graph')
-        ctanalyzer.page_main.update_graphx(self.figures['prepare'])
+        if show:
+            ctanalyzer.page_main.update_graphx(self.render('prepare'))
 
-    def call_master(self):
-        # flush previous, check if data was preprocessed
-        if 'master_curves' in self.figures:
-            plt.close(self.figures['master_curves'])
+    def call_master(self, show=True):
+        # flush previous unless its stage is unchanged, check if data was preprocessed
+        self.flush_stale('master', 'master_curves')
         if self.df_prepro.empty:
             ctanalyzer.page_main.update_console('ERROR: Please preprocess data first')
             return
 
-        figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
-        self.master_results, self.figures['master_curves'] = preprocessing.get_master_curves(
-            self.df_prepro, self.dict_prepro['hills'],
-            self.dict_prepro['valleys'], figsize=figsize)
+        self.master_results = self.pipeline.run('master', self.settings_values())
 
+        self.plotters['master_curves'] = functools.partial(preprocessing.plot_master_curves, self.master_results)
         ctanalyzer.page_main.update_console(f'Successfully calculated master curves')
-        ctanalyzer.page_main.update_graphx(self.figures['master_curves'])
+        if show:
+            ctanalyzer.page_main.update_graphx(self.render('master_curves'))
 
-    def call_fit(self):
-        # flush previous, check if data was preprocessed
-        if 'linear' in self.figures:
-            plt.close(self.figures['linear'])
+    def call_fit(self, show=True):
+        # flush previous unless its stage is unchanged, check if data was preprocessed
+        self.flush_stale('fit', 'linear')
         if self.df_prepro.empty:
             ctanalyzer.page_main.update_console('ERROR: Please preprocess data first')
             return
 
-        # catch string properties from settings
-        range_filter = {'type': ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                        'range_filter'),
-                        'lower_strain': float(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                      'lower_strain')),
-                        'upper_strain': float(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                      'upper_strain')),
-                        'rel_cutoff_pct': int(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                      'rel_cutoff_pct')),
-                        'no_sections': int(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                   'no_sections')),
-                        'smoothing_dynamic': int(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                         'smoothing_dynamic')),
-                        'dynamic_line_divisor': int(ctanalyzer.get_running_app().config.get('Analysis Settings',
-                                                                                            'dynamic_line_divisor'))}
-
-        figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
+        # the fit stage reads the range filter and the executor settings
+        values = self.settings_values()
+        self.fit_results = self.pipeline.run('fit', values)
 
-        self.fit_results, self.figures['linear'] = fit.linear(self.df_prepro, self.dict_prepro['dfs_grouped'],
-                                                              range_filter, figsize=figsize)
-
-        self.parameters['range_filter'] = range_filter
+        self.parameters['range_filter'] = analysis_settings.range_filter(values)
+        self.parameters.update(analysis_settings.fit_kwargs(values, processes=False))
+        self.plotters['linear'] = functools.partial(fit.plot_linear, self.df_prepro, self.fit_results)
 
         try:
             r2_load = self.fit_results['loading']['r2'].values
@@ -232,28 +191,35 @@ class CTAnalyzer(App):
             ctanalyzer.page_main.update_console(f'Successfully evaluated linear fit. Mean r²: {mean}')
         except statistics.StatisticsError:
             ctanalyzer.page_main.update_console('ERROR: Evaluation unsuccessful! Not even one single fit possible')
-        ctanalyzer.page_main.update_graphx(self.figures['linear'])
+        if show:
+            ctanalyzer.page_main.update_graphx(self.render('linear'))
 
-    def call_hyst(self):
-        # flush previous, check if data was loaded
-        if 'calc' in self.figures:
-            plt.close(self.figures['calc'])
+    def call_hyst(self, show=True):
+        # flush previous unless its stage is unchanged, check if data was preprocessed
+        self.flush_stale('hysteresis', 'calc')
         if self.df_prepro.empty:
             ctanalyzer.page_main.update_console('ERROR: Please preprocess data first')
             return
 
-        # catch string properties from settings
-        smoothing_hyst = ctanalyzer.get_running_app().config.get('Analysis Settings', 'smoothing_hyst')
+        values = self.settings_values()
+        self.hyst_results = self.pipeline.run('hysteresis', values)
 
-        figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
-        self.hyst_results, self.figures['calc'] = hysteresis.calc(self.dict_prepro['dfs_grouped'],
-                                                                  smoothing=int(smoothing_hyst),
-                                                                  figsize=figsize)
+        # rainflow histograms of the turning points for fatigue evaluations
+        self.rainflow_results = self.pipeline.run('rainflow', values)
 
-        # save parameter and update UI
-        self.parameters['smoothing_hyst'] = smoothing_hyst
+        # all cycles resampled onto a common phase axis for the cross-cycle evaluations
+        self.phase_results = self.pipeline.run('phase', values)
+
+        # save parameter, converted like by the pipeline stages, and update UI
+        self.parameters['smoothing_hyst'] = int(values['smoothing_hyst'])
+        self.parameters['rainflow_strain_bin'] = float(values['rainflow_strain_bin'])
+        self.parameters['rainflow_stress_bin'] = float(values['rainflow_stress_bin'])
+        self.parameters['phase_points'] = int(values['phase_points'])
+        self.plotters['calc'] = functools.partial(hysteresis.plot_calc, self.dict_prepro['cycles'],
+                                                  smoothing=self.parameters['smoothing_hyst'])
         ctanalyzer.page_main.update_console(f'Successfully calculated hysteresis: {len(self.hyst_results)} areas')
-        ctanalyzer.page_main.update_graphx(self.figures['calc'])
+        if show:
+            ctanalyzer.page_main.update_graphx(self.render('calc'))
 
     def call_save(self):
         # check if data was loaded
@@ -263,21 +229,58 @@ class CTAnalyzer(App):
 
         content = {'meta_data': self.meta_data, 'master_results': self.master_results,
                    'hyst_results': self.hyst_results, 'fit_results': self.fit_results,
+                   'rainflow_results': self.rainflow_results, 'phase_results': self.phase_results,
                    'dict_prepro': self.dict_prepro, 'parameters': self.parameters}
 
+        # figures that were never shown are built now, exports get every sample unless decimation is enabled for them
+        decimate_exports = ctanalyzer.get_running_app().config.get('Analysis Settings', 'decimate_exports') == '1'
+        if decimate_exports:
+            figures = {name: self.render(name) for name in self.plotters}
+        else:
+            figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
+            figures = {name: self.plotters[name](figsize=figsize) for name in self.plotters}
+
         io_data.save_data(ctanalyzer.get_running_app().config.get('Analysis Settings', 'output_path'),
-                          content, self.figures, sample_name=self.meta_data['Specimen designation'])
+                          content, figures, sample_name=self.meta_data['Specimen designation'])
+
+        # full resolution figures are only built for the export
+        if not decimate_exports:
+            for fig in figures.values():
+                plt.close(fig)
 
         ctanalyzer.page_main.update_console(
             f'Successfully saved! See {ctanalyzer.get_running_app().config.get("Analysis Settings", "output_path")}')
 
     def call_all_in_one(self):
-        self.call_prepare()
-        self.call_master()
-        self.call_fit()
+        # only the last figure is shown, the others are built when saving
+        self.call_prepare(show=False)
+        self.call_master(show=False)
+        self.call_fit(show=False)
         self.call_hyst()
         self.call_save()
 
+    def render(self, name):
+        if self.figures.get(name) is None:
+            figsize = (self.page_main.figure.width/100, self.page_main.figure.height/100)
+            self.figures[name] = self.plotters[name](figsize=figsize, **self.decimation())
+        return self.figures[name]
+
+    def decimation(self):
+        # plots on the canvas never need more points than it has pixels
+        method = ctanalyzer.get_running_app().config.get('Analysis Settings', 'plot_decimation')
+        return {'max_points': downsample.POINTS_PER_PIXEL * int(self.page_main.figure.width), 'decimation': method}
+
+    def flush_stale(self, stage, name):
+        # a figure stays valid as long as the stage it shows is unchanged
+        if self.pipeline is None or not self.pipeline.is_current(stage, self.settings_values()):
+            self.flush_figure(name)
+
+    def flush_figure(self, name):
+        if self.figures.get(name) is not None:
+            plt.close(self.figures[name])
+        self.figures.pop(name, None)
+        self.plotters.pop(name, None)
+
 
 if __name__ == '__main__':
     ctanalyzer = CTAnalyzer()
@@ -0,0 +1,130 @@
+import configparser
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SECTION = 'Analysis Settings'
+
+
+def defaults():
+    # settings at first startup, shared by the GUI (overridden by ctanalyzer.ini if existing) and the batch CLI
+    return {'split_peaks': 0,
+            'filter_value': 0.005,
+            'is_percent': 1,
+            'output_path': os.path.join(os.getcwd(), 'results'),
+            'use_cache': 0,
+            'cache_path': os.path.join(os.getcwd(), 'cache'),
+            'cache_size': 2048,
+            'out_of_core_mb': 1024,
+            'x_dimensions': 1.3,
+            'y_dimensions': 10.0,
+            'factor': 100,
+            'smoothing_pre': 15,
+            'smoothing_method': 'Moving average',
+            'peak_distance': 5,
+            'peak_width': 5,
+            'range_filter': 'Static strain',
+            'upper_strain': 0.25,
+            'lower_strain': 0.05,
+            'rel_cutoff_pct': 25,
+            'no_sections': 5,
+            'section_stride_pct': 100,
+            'window_min_samples': 50,
+            'window_min_strain': 0.0,
+            'window_criterion': 'Highest r2',
+            'smoothing_dynamic': 35,
+            'dynamic_line_divisor': 5,
+            'fit_executor': 'serial',
+            'fit_workers': 0,
+            'smoothing_hyst': 16,
+            'rainflow_strain_bin': 0.005,
+            'rainflow_stress_bin': 1.0,
+            'phase_points': 100,
+            'plot_decimation': 'LTTB',
+            'decimate_exports': 0,
+            'monitor_gate': 0.01,
+            'monitor_baseline': 20,
+            'monitor_drift': 0.5,
+            'monitor_threshold': 5.0,
+            'monitor_drop_pct': 10.0}
+
+
+def read(path_to_file=None):
+    logger.info(f'Called read with {path_to_file}')
+
+    values = defaults()
+    if path_to_file is None:
+        return values
+
+    # either the ini file written by the GUI or a flat json dict with the same keys
+    if path_to_file.lower().endswith('.json'):
+        with open(path_to_file, 'r') as file:
+            values.update(json.load(file))
+    else:
+        parser = configparser.ConfigParser()
+        parser.read(path_to_file)
+        if parser.has_section(SECTION):
+            values.update(parser[SECTION])
+
+    unknown = set(values) - set(defaults())
+    if unknown:
+        logger.warning(f'Ignoring unknown settings: {sorted(unknown)}')
+
+    return values
+
+
+def as_bool(value):
+    return str(value).strip().lower() in ['1', 'true', 'yes', 'on']
+
+
+def prepare_kwargs(values):
+    # keyword arguments of preprocessing.prepare, converted like in CTAnalyzer.call_prepare
+    return {'split_peaks': as_bool(values['split_peaks']),
+            'filter_value': float(values['filter_value']),
+            'x_dimensions': float(values['x_dimensions']),
+            'y_dimensions': float(values['y_dimensions']),
+            'factor': int(values['factor']),
+            'smoothing': int(values['smoothing_pre']),
+            'smoothing_method': values['smoothing_method'],
+            'distance': int(values['peak_distance']),
+            'width': int(values['peak_width'])}
+
+
+def range_filter(values):
+    return {'type': values['range_filter'],
+            'lower_strain': float(values['lower_strain']),
+            'upper_strain': float(values['upper_strain']),
+            'rel_cutoff_pct': int(values['rel_cutoff_pct']),
+            'no_sections': int(values['no_sections']),
+            'section_stride_pct': int(values['section_stride_pct']),
+            'window_min_samples': int(values['window_min_samples']),
+            'window_min_strain': float(values['window_min_strain']),
+            'window_criterion': values['window_criterion'],
+            'smoothing_dynamic': int(values['smoothing_dynamic']),
+            'dynamic_line_divisor': int(values['dynamic_line_divisor'])}
+
+
+def fit_kwargs(values, processes=True):
+    # keyword arguments of fit.linear besides the range filter, 0 workers means one per CPU. Without processes the
+    # process executor falls back to threads: worker processes started from the GUI re-import main.py with Kivy and
+    # its window under spawn (Windows, macOS), and batch workers must not start pools of their own
+    executor = values['fit_executor']
+    if executor == 'processes' and not processes:
+        executor = 'threads'
+    return {'executor': executor,
+            'workers': int(values['fit_workers']) or None}
+
+
+def monitor_kwargs(values):
+    # keyword arguments of monitor.CycleMonitor besides the range filter
+    return {'x_dimensions': float(values['x_dimensions']),
+            'y_dimensions': float(values['y_dimensions']),
+            'smoothing': int(values['smoothing_pre']),
+            'gate': float(values['monitor_gate']),
+            'smoothing_hyst': int(values['smoothing_hyst']),
+            'baseline': int(values['monitor_baseline']),
+            'drift': float(values['monitor_drift']),
+            'threshold': float(values['monitor_threshold']),
+            'drop_pct': float(values['monitor_drop_pct'])}
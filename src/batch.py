@@ -0,0 +1,296 @@
+import argparse
+import collections
+import concurrent.futures
+import glob
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+import numpy as np
+import pandas as pd
+from statistics import mean
+
+from src import analysis_settings, fit, hysteresis, io_data, out_of_core, phase, preprocessing, rainflow
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = ['.txt', '.csv']
+
+
+def find_files(inputs):
+    logger.info(f'Called find_files with {inputs}')
+
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in sorted(os.listdir(item))]
+        else:
+            candidates = sorted(glob.glob(item))
+
+        for candidate in candidates:
+            filename = io_data.strip_compression(candidate.lower())
+            if os.path.isfile(candidate) and os.path.splitext(filename)[1] in EXTENSIONS and candidate not in files:
+                files.append(candidate)
+
+    logger.info(f'Found {len(files)} input files')
+    return files
+
+
+def read_designation(path_to_file):
+    # specimen designation from the header only, None if the header cannot be parsed
+    try:
+        with io_data.open_input(path_to_file) as input_file:
+            meta, names = io_data.read_header(input_file)
+        return meta.get('Specimen designation')
+    except Exception:
+        return None
+
+
+def output_names(files):
+    # output folder of every file: its specimen designation, or its file name if several files share the designation
+    # or it cannot be read, so that no two workers write into the same folder
+    designations = [read_designation(path_to_file) for path_to_file in files]
+    counts = collections.Counter(designations)
+
+    names = {}
+    used = {designation for designation in designations if designation is not None and counts[designation] == 1}
+    for path_to_file, designation in zip(files, designations):
+        if designation is not None and counts[designation] == 1:
+            names[path_to_file] = designation
+            continue
+        if designation is not None:
+            logger.warning(f'{path_to_file} shares the specimen designation {designation} with other files, saving '
+                           f'its results under the file name')
+
+        # file names can collide as well, e.g. the same name in two input directories
+        stem = os.path.splitext(os.path.basename(io_data.strip_compression(path_to_file)))[0]
+        name, n = stem, 1
+        while name in used:
+            n += 1
+            name = f'{stem}_{n}'
+        used.add(name)
+        names[path_to_file] = name
+
+    return names
+
+
+def process_file(path_to_file, values, with_figures=False, sample_name=None):
+    # runs the complete pipeline for one specimen, errors are reported instead of raised so that one broken file
+    # never stops the rest of the campaign. Results are saved under sample_name, the specimen designation by default
+    start = time.time()
+    summary = {'file': path_to_file, 'specimen': None, 'output': None, 'status': 'failed', 'cycles': 0,
+               'mean_r2': None, 'seconds': None, 'error': None}
+
+    folder = None
+    try:
+        if is_large(path_to_file, values):
+            folder = tempfile.mkdtemp(prefix='ctanalyzer_')
+        evaluate(path_to_file, values, with_figures, sample_name, summary, folder)
+
+    except Exception as error:
+        summary['error'] = f'{type(error).__name__}: {error}'
+        logger.error(f'Failed on {path_to_file}\n{traceback.format_exc()}')
+
+    finally:
+        if with_figures:
+            import matplotlib.pyplot as plt
+            plt.close('all')
+
+        # the maps of the converted columns are closed once evaluate returned
+        if folder is not None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    summary['seconds'] = round(time.time() - start, 3)
+    return summary
+
+
+def is_large(path_to_file, values):
+    # files above out_of_core_mb (0 disables it) are evaluated on memory-mapped columns, compressed files are rated
+    # by their estimated text size
+    limit = float(values['out_of_core_mb'])
+    size = os.stat(path_to_file).st_size
+    if io_data.strip_compression(path_to_file) != path_to_file:
+        size *= io_data.COMPRESSION_RATIO
+    return limit > 0 and size > limit * 1024 * 1024
+
+
+def evaluate(path_to_file, values, with_figures, sample_name, summary, folder=None):
+    # the pipeline of one file filling in summary, on memory-mapped columns converted into folder if given
+    is_percent = analysis_settings.as_bool(values['is_percent'])
+    if folder is not None:
+        logger.info(f'Evaluating {path_to_file} out of core in {folder}')
+        columns, meta = out_of_core.convert(path_to_file, folder, is_percent=is_percent)
+        empty = len(columns.get('Standard travel', [])) == 0
+    elif analysis_settings.as_bool(values['use_cache']):
+        df, meta = io_data.load_cached(path_to_file, values['cache_path'], is_percent=is_percent,
+                                       max_mb=int(values['cache_size']))
+        empty = df.empty
+    else:
+        df, meta = io_data.load_data(path_to_file, is_percent=is_percent)
+        empty = df.empty
+
+    if 'Specimen designation' not in meta or empty:
+        raise ValueError('Please check input file formatting')
+    summary['specimen'] = meta['Specimen designation']
+    summary['output'] = meta['Specimen designation'] if sample_name is None else sample_name
+
+    content, figures = {}, {}
+    if folder is not None:
+        df_prepro, dict_prepro, df_rainflow = prepare_mapped(columns, values)
+    else:
+        df_prepro, dict_prepro = preprocessing.prepare(df, **analysis_settings.prepare_kwargs(values))
+        df_rainflow = df_prepro
+    content['master_results'] = preprocessing.get_master_curves(df_prepro, dict_prepro['hills'],
+                                                                dict_prepro['valleys'])
+
+    # the files are spread over the worker processes, the fit borders of one file use threads at most
+    range_filter = analysis_settings.range_filter(values)
+    content['fit_results'] = fit.linear(df_prepro, dict_prepro['cycles'], range_filter,
+                                       **analysis_settings.fit_kwargs(values, processes=False))
+    content['hyst_results'] = hysteresis.calc(dict_prepro['cycles'], smoothing=int(values['smoothing_hyst']))
+    content['rainflow_results'] = rainflow.calc(df_rainflow, dict_prepro,
+                                                strain_bin_width=float(values['rainflow_strain_bin']),
+                                                stress_bin_width=float(values['rainflow_stress_bin']))
+    content['phase_results'] = phase.calc(dict_prepro['cycles'], n_points=int(values['phase_points']))
+
+    # figure building is often slower than the evaluation itself, it is skipped unless requested; batch runs
+    # only ever write figures to disk, so matplotlib gets the non-interactive backend. The curves of the whole test
+    # are not in memory out of core, their figures are left out
+    if with_figures:
+        import matplotlib
+        matplotlib.use('Agg')
+        if folder is None:
+            figures['prepare'] = preprocessing.plot_prepare(df_prepro, dict_prepro)
+            figures['linear'] = fit.plot_linear(df_prepro, content['fit_results'])
+        figures['master_curves'] = preprocessing.plot_master_curves(content['master_results'])
+        figures['calc'] = hysteresis.plot_calc(dict_prepro['cycles'], smoothing=int(values['smoothing_hyst']))
+
+    content['meta_data'] = meta
+    content['dict_prepro'] = dict_prepro
+    content['parameters'] = dict(values, range_filter=range_filter)
+    io_data.save_data(values['output_path'], content, figures, sample_name=summary['output'])
+
+    r2 = list(content['fit_results']['loading']['r2']) + list(content['fit_results']['unloading']['r2'])
+    summary['cycles'] = len(dict_prepro['cycles'])
+    summary['mean_r2'] = mean(r2) if r2 else None
+    summary['status'] = 'ok'
+
+
+def prepare_mapped(columns, values):
+    # out-of-core preprocessing, the frame only holds the rows at the peaks, which is all the master curves need;
+    # fit, hysteresis and phase read the cycle table and the rainflow count the columns up to the end of the test.
+    # The frames of the whole test in the results of preprocessing.prepare are left out
+    d = out_of_core.prepare(columns, **analysis_settings.prepare_kwargs(values))
+
+    def rows(*peaks):
+        positions = np.sort(np.concatenate(peaks)).astype(np.int64)
+        return pd.DataFrame({name: np.asarray(column[positions]) for name, column in d['cycles'].columns.items()},
+                            index=positions)
+
+    # peaks like the ones of preprocessing.prepare
+    df_peaks = rows(d['hills'], d['valleys'])
+    if d['preloading']:
+        peaks = {name: pd.Series(d[name], index=d[name]) for name in ['hills', 'valleys']}
+        preloading = {name: pd.Series(found, index=found) for name, found in d['preloading'].items()}
+        df_min_max = {'preloading': rows(*d['preloading'].values()), 'normal': df_peaks}
+    else:
+        peaks = {name: pd.Series(d[name]) for name in ['hills', 'valleys']}
+        preloading = {}
+        df_min_max = df_peaks
+    dict_prepro = dict(peaks, df_min_max=df_min_max, preloading=preloading, cycles=d['cycles'])
+
+    mapped = {name: columns[name][:d['n_end']] for name in ['Standard travel', 'Standard stress']}
+    return df_peaks, dict_prepro, mapped
+
+
+def run(files, values, workers=None, with_figures=False):
+    logger.info(f'Called run for {len(files)} files with {workers} workers')
+
+    names = output_names(files)
+    if workers == 1:
+        summaries = [process_file(path_to_file, values, with_figures, names[path_to_file]) for path_to_file in files]
+    else:
+        summaries, pending = run_pool(files, names, values, workers, with_figures)
+
+        # a worker process that dies (e.g. killed for its memory) breaks the whole pool, every pending future then
+        # raises BrokenProcessPool. The files left over run again in a pool of their own each, so only the file that
+        # crashed its worker is reported as failed
+        for path_to_file in pending:
+            retried, crashed = run_pool([path_to_file], names, values, 1, with_figures)
+            summaries += retried or [{'file': path_to_file, 'output': names[path_to_file], 'status': 'failed',
+                                      'error': 'BrokenProcessPool: the worker process terminated abruptly'}]
+
+    # report in input order, not in completion order
+    order = {path_to_file: n for n, path_to_file in enumerate(files)}
+    report = pd.DataFrame(sorted(summaries, key=lambda summary: order[summary['file']]))
+
+    logger.info(f'{(report["status"] == "ok").sum() if not report.empty else 0} of {len(files)} files processed')
+    return report
+
+
+def run_pool(files, names, values, workers=None, with_figures=False):
+    # summaries of the files finished in one process pool and the files left over if the pool broke
+    summaries, finished = [], set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, path_to_file, values, with_figures, names[path_to_file]):
+                   path_to_file for path_to_file in files}
+        for future in concurrent.futures.as_completed(futures):
+            path_to_file = futures[future]
+            try:
+                summary = future.result()
+            except BrokenProcessPool:
+                continue
+            except Exception as error:
+                summary = {'file': path_to_file, 'output': names[path_to_file], 'status': 'failed',
+                           'error': f'{type(error).__name__}: {error}'}
+            logger.info(f'{summary["status"]}: {path_to_file}')
+            summaries.append(summary)
+            finished.add(path_to_file)
+
+    return summaries, [path_to_file for path_to_file in files if path_to_file not in finished]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate every cyclic test file of a directory or glob pattern.')
+    parser.add_argument('inputs', nargs='+', help='directories or glob patterns of input files')
+    parser.add_argument('-s', '--settings', default=None,
+                        help='ctanalyzer.ini or a json file with the keys of the GUI settings')
+    parser.add_argument('-o', '--output', default=None, help='overrides the output path of the settings')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('-f', '--figures', action='store_true', help='also build and save the figures')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every pipeline step')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO if args.verbose else logging.WARNING)
+
+    values = analysis_settings.read(args.settings)
+    if args.output is not None:
+        values['output_path'] = args.output
+
+    files = find_files(args.inputs)
+    if not files:
+        print('No input files found')
+        return 1
+
+    report = run(files, values, workers=args.workers, with_figures=args.figures)
+
+    if not os.path.isdir(values['output_path']):
+        os.makedirs(values['output_path'])
+    report.to_csv(os.path.join(values['output_path'], 'batch_summary.TXT'), sep='\t', index=False)
+
+    print(report.to_string(index=False))
+    return 0 if (report['status'] == 'ok').all() else 2
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
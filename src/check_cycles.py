@@ -0,0 +1,92 @@
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import preprocessing
+
+logger = logging.getLogger(__name__)
+
+
+# parity of preprocessing.groupify with the list-based grouping it replaced, for tests starting on a hill and in a
+# valley, with and without pre-loading. Run with "python src/check_cycles.py", exits with 1 on a mismatch
+def list_groupify(df_end, df_min_max, hills, valleys):
+    # the former implementation, chunks are DataFrame slices between the peaks
+    dfs_chunks = []
+    prev = 0
+    for row in df_min_max.iterrows():
+        dfs_chunks.append(df_end.iloc[prev:row[0]])
+        prev = row[0]
+    dfs_chunks.append(df_end.iloc[prev:])
+
+    dfs_grouped = []
+    if len(hills) != 0 and len(valleys) != 0:
+        if hills.values.flat[0] < valleys.values.flat[0]:
+            for i in range(1, len(dfs_chunks), 2):
+                dfs_grouped.append([dfs_chunks[i - 1], dfs_chunks[i]])
+            if len(dfs_chunks) % 2 != 0:
+                dfs_grouped.append([dfs_chunks[-1]])
+        else:
+            dfs_grouped = [[dfs_chunks[0]]]
+            for i in range(2, len(dfs_chunks), 2):
+                dfs_grouped.append([dfs_chunks[i - 1], dfs_chunks[i]])
+            if len(dfs_chunks) % 2 == 0:
+                dfs_grouped.append([dfs_chunks[-1]])
+
+    return dfs_chunks, dfs_grouped
+
+
+def synthetic_export(n_cycles=20, period=200, phase=0.0, preloading=0, seed=0):
+    # triangular strain cycles with noise, a phase of 0.5 starts on a hill so that the first peak is a valley.
+    # Pre-loading adds cycles of growing amplitude in front
+    rng = np.random.default_rng(seed)
+    t = np.arange((n_cycles + preloading) * period, dtype=np.float64)
+    position = (t / period + phase) % 1
+    travel = 0.1 + 0.2 * np.where(position < 0.5, 2 * position, 2 - 2 * position)
+    if preloading:
+        growth = np.minimum(t / (preloading * period), 1)
+        travel = 0.1 + (travel - 0.1) * np.where(growth < 1, 0.3 + 0.6 * growth, 1)
+    travel += rng.normal(0, 2e-4, len(t))
+    force = travel * 2000 + rng.normal(0, 0.5, len(t))
+    return pd.DataFrame({'Test time': t / 10, 'Standard force': force, 'Standard travel': travel,
+                         'Strain': travel * 0.3})
+
+
+def compare(df_end, df_min_max, hills, valleys):
+    cycles = preprocessing.groupify(df_end, df_min_max, hills, valleys)
+    dfs_chunks, dfs_grouped = list_groupify(df_end, df_min_max, hills, valleys)
+
+    expected = [[(chunk.index[0], chunk.index[-1] + 1) if len(chunk) else None for chunk in group]
+                for group in dfs_grouped]
+    found = [[(cycles.start[n], cycles.stop[n]) if cycles.stop[n] > cycles.start[n] else None
+              for n in cycles.halves[c] if n >= 0] for c in range(len(cycles))]
+    return expected == found, len(expected), len(found)
+
+
+def main():
+    failed = False
+    for label, phase, preloading in [('hill first', 0.0, 0), ('valley first', 0.5, 0),
+                                     ('pre-loading, hill first', 0.0, 4), ('pre-loading, valley first', 0.5, 4)]:
+        df = preprocessing.calculate_stress(synthetic_export(phase=phase, preloading=preloading), 1.3, 10.0)
+        df_end = preprocessing.cut_end(df, 50)
+        split_peaks = preloading > 0
+        df_min_max, hills, valleys, smooth = preprocessing.detect_peaks(df_end, 15, 5, 5, split_peaks, 0.005)
+        if split_peaks:
+            df_min_max, hills, valleys = df_min_max['normal'], hills['normal'], valleys['normal']
+
+        equal, n_expected, n_found = compare(df_end, df_min_max, hills, valleys)
+        first = 'hill' if hills.values[0] < valleys.values[0] else 'valley'
+        print(f'{label:28s} first peak: {first:6s} cycles: {n_expected} list, {n_found} table  '
+              f'{"ok" if equal else "MISMATCH"}')
+        failed |= not equal
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import io
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+import tempfile
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import io_data
+
+logger = logging.getLogger(__name__)
+
+HEADER = ['"Specimen designation"\t"S-01"', '"Test date"\t"01.02.2020"\t"12:00"', '"Width"\t"1,3"\t"mm"',
+          '"Test time"\t"Standard force"\t"Standard travel"\t"Strain"', '"s"\t"N"\t"%"\t"mm"']
+
+
+# parity of io_data.parse_block_fixed with the general parser it falls back to and with the former whole-file
+# pd.read_csv(..., decimal=',') of load_data, compared bit for bit. Run with "python src/check_parse.py", exits with 1
+# on a mismatch
+def old_read(path_to_file, names):
+    # the former body parser, the units line is the header row replaced by the names
+    df = pd.read_csv(path_to_file, sep='\t',
+                     header=0, names=names,
+                     skiprows=4, index_col=False,
+                     decimal=',')
+    return df.values.astype(np.float64)
+
+
+def fallback_parse(block, n_columns):
+    # the general parser of io_data.parse_block
+    df_block = pd.read_csv(io.BytesIO(block), sep='\t',
+                           header=None, names=list(range(n_columns)),
+                           index_col=False, decimal=',')
+    return df_block.values.astype(np.float64)
+
+
+def same_bits(a, b):
+    # NaNs are equal to each other, everything else has to match to the last bit, including the sign of zero
+    a, b = np.ascontiguousarray(a, dtype=np.float64), np.ascontiguousarray(b, dtype=np.float64)
+    if a.shape != b.shape:
+        return False
+    missing = np.isnan(a)
+    return bool(np.array_equal(missing, np.isnan(b)) and
+                np.array_equal(a[~missing].view(np.int64), b[~missing].view(np.int64)))
+
+
+def synthetic_rows(n_rows=5000, seed=0):
+    # random magnitudes over many decades, written with full precision, with exponents and with a decimal comma
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 1, (n_rows, 4)) * 10.0 ** rng.integers(-12, 12, (n_rows, 4))
+    values[::97, 1] = 0.0
+    values[::89, 2] = -0.0
+    return [[repr(value).replace('.', ',') for value in row] for row in values]
+
+
+def cases():
+    rows = synthetic_rows()
+    plain = ['\t'.join(['0,5', '-1', '2,25', '-0,000125'])] * 3
+    exponents = ['\t'.join(['1e3', '-2,5E-07', '3,25e+02', '-0,1e-300'])] * 3
+    yield 'negatives and exponents', ['\t'.join(row) for row in rows] + plain + exponents, '\n', True
+    yield 'windows line ends', ['\t'.join(row) for row in rows], '\r\n', True
+    yield 'empty fields', ['\t'.join(row[:2] + [''] + row[3:]) if i % 50 == 0 else '\t'.join(row)
+                           for i, row in enumerate(rows)], '\n', False
+    yield 'ragged rows', ['\t'.join(row[:3]) if i % 70 == 0 else '\t'.join(row)
+                          for i, row in enumerate(rows)], '\n', False
+
+
+def check(label, lines, newline, fixed_layout):
+    text = newline.join(HEADER + lines) + newline
+    body = newline.join(lines).encode(io_data.ENCODING) + newline.encode(io_data.ENCODING)
+    names = ['Test time', 'Standard force', 'Standard travel', 'Strain']
+
+    with tempfile.TemporaryDirectory() as folder:
+        path_to_file = os.path.join(folder, 'specimen.txt')
+        with open(path_to_file, 'w', encoding=io_data.ENCODING, newline='') as output_file:
+            output_file.write(text)
+
+        expected = old_read(path_to_file, names)
+        fallback = fallback_parse(body, len(names))
+
+        # the fixed parser rejects rows that are not n complete floats, load_data then uses the fallback
+        try:
+            fixed = io_data.parse_block_fixed(body, len(names))
+        except ValueError:
+            fixed = None
+        results = [('fallback', fallback), ('load_data', io_data.load_data(path_to_file)[0].values)]
+        if fixed is not None:
+            results.append(('parse_block_fixed', fixed))
+
+        # small blocks cut rows at arbitrary positions and mix both parsers in one file
+        results.append(('load_data 4 kB blocks', io_data.load_data(path_to_file, chunk_bytes=4096)[0].values))
+
+    failed = (fixed is None) == fixed_layout
+    print(f'{label:24s} rows: {len(expected):5d}  fixed parser: {"used" if fixed is not None else "rejected"}')
+    for name, values in results:
+        equal = same_bits(expected, values)
+        print(f'    {name:22s} {"ok" if equal else "MISMATCH"}')
+        failed |= not equal
+    return failed
+
+
+def main():
+    failed = False
+    for label, lines, newline, fixed_layout in cases():
+        failed |= check(label, lines, newline, fixed_layout)
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
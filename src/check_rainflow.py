@@ -0,0 +1,53 @@
+import logging
+import numpy as np
+import os
+import sys
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import rainflow
+
+logger = logging.getLogger(__name__)
+
+# cycles per range of the ASTM E1049 rainflow example (Fig. 6), and of a history whose last point closes a range
+CASES = [('ASTM E1049 Fig. 6', [-2, 1, -3, 5, -1, 3, -4, 4, -2], {3: 0.5, 4: 1.5, 6: 0.5, 8: 1.0, 9: 0.5}),
+         ('closing last point', [0, 2, 1, 3], {1: 1.0, 3: 0.5})]
+
+
+# rainflow.RainflowCounter against the cycles worked out by hand, counted at once and pushed point by point. Run with
+# "python src/check_rainflow.py", exits with 1 on a mismatch
+def cycles_per_range(counter):
+    # integer ranges with a bin width of 1, the bin centers are at range + 0.5
+    df = counter.to_frame()
+    counts = df.groupby(np.floor(df['range']).astype(int))['cycles'].sum()
+    return {int(value_range): float(cycles) for value_range, cycles in counts.items()}
+
+
+def main():
+    failed = False
+    for name, values, expected in CASES:
+        streamed = rainflow.RainflowCounter(1.0)
+        for value in values:
+            streamed.push([value])
+
+        for mode, counter in [('at once', rainflow.count(values, 1.0)), ('streamed', streamed)]:
+            found = cycles_per_range(counter)
+            equal = found == expected
+            print(f'{name:20s} {mode:10s} {found}  {"ok" if equal else "MISMATCH, expected " + str(expected)}')
+            failed |= not equal
+
+        # reading the histogram leaves the stack untouched, counting goes on afterwards
+        counter = rainflow.count(values[:-1], 1.0)
+        counter.to_frame()
+        counter.push(values[-1:])
+        continued = cycles_per_range(counter) == expected
+        print(f'{name:20s} {"continued":10s} {"ok" if continued else "MISMATCH"}')
+        failed |= not continued
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import logging
+import numpy as np
+import os
+import sys
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import fit
+
+logger = logging.getLogger(__name__)
+
+
+# 'Best window' search of fit.best_window against the exhaustive search over all intervals from np.triu_indices on
+# small noisy chunks. Chunks within fit.EXHAUSTIVE_WINDOWS are searched exhaustively, longer ones by branch and bound,
+# both have to give the optimum within TOLERANCE: in r² for 'Highest r2', relative to the optimal residual per sample
+# for 'Lowest residual'. The shortfall of the approximate search seeding the bounds is reported as well. Run with
+# "python src/check_window.py", exits with 1 if a result is not optimal or violates the constraints
+TOLERANCE = 1e-8
+
+
+def exhaustive_window(x, y, min_samples, min_strain, criterion):
+    # every interval [start, stop) with at least min_samples samples, O(n²)
+    min_samples = max(min_samples, 2)
+    starts, stops = np.triu_indices(len(x) + 1, k=min_samples)
+    scores = fit.window_objective(x, fit.prefix_sums(x, y), starts, stops, min_samples, min_strain, criterion)
+    if len(scores) == 0 or not np.isfinite(scores.max()):
+        return 0, 0, -np.inf
+    k = np.argmax(scores)
+    return int(starts[k]), int(stops[k]), scores[k]
+
+
+def synthetic_chunk(rng):
+    # loading half with a soft toe, a linear part and a yielding end, noise of varying strength
+    n = int(rng.integers(40, 700))
+    x = np.linspace(0, rng.uniform(0.2, 0.6), n)
+    toe, knee = rng.uniform(0.05, 0.3) * x[-1], rng.uniform(0.6, 0.95) * x[-1]
+    y = 2000 * x - 2000 * toe * np.exp(-x / max(toe, 1e-6)) - rng.uniform(2e3, 2e4) * np.maximum(x - knee, 0) ** 2
+    y += rng.normal(0, rng.uniform(0.1, 20), n)
+    return x, y
+
+
+def score(x, y, start, stop, min_samples, min_strain, criterion):
+    return fit.window_objective(x, fit.prefix_sums(x, y), np.array([start]), np.array([stop]), max(min_samples, 2),
+                                min_strain, criterion)[0]
+
+
+def shortfall(best, found, criterion):
+    return (best - found) / (abs(best) if criterion == 'Lowest residual' else 1)
+
+
+def main(n_chunks=300, seed=0):
+    rng = np.random.default_rng(seed)
+    failed = False
+    for criterion in ['Highest r2', 'Lowest residual']:
+        found, approximate = {'exhaustive': [], 'pruned': []}, []
+        for _ in range(n_chunks):
+            x, y = synthetic_chunk(rng)
+            min_samples = int(rng.integers(10, 40))
+            min_strain = float(rng.choice([0.0, 0.05]))
+            best_start, best_stop, best = exhaustive_window(x, y, min_samples, min_strain, criterion)
+            if not np.isfinite(best):
+                failed |= fit.best_window(x, y, min_samples, min_strain, criterion) != (0, 0)
+                continue
+
+            # the search used by best_window for this chunk has to find the optimum, any interval it returns has to
+            # be admissible
+            n_windows = (len(x) - min_samples + 1) * (len(x) - min_samples + 2) // 2
+            path = 'exhaustive' if n_windows <= fit.EXHAUSTIVE_WINDOWS else 'pruned'
+            value = score(x, y, *fit.best_window(x, y, min_samples, min_strain, criterion), min_samples, min_strain,
+                          criterion)
+            found[path].append(shortfall(best, value, criterion) if np.isfinite(value) else np.inf)
+
+            start, stop, value = fit.approximate_window(x, fit.prefix_sums(x, y), max(min_samples, 2), min_strain,
+                                                        criterion)
+            approximate.append(shortfall(best, score(x, y, start, stop, min_samples, min_strain, criterion),
+                                         criterion))
+
+        for path, shortfalls in list(found.items()) + [('approximate', approximate)]:
+            shortfalls = np.array(shortfalls)
+            optimal = np.count_nonzero(shortfalls <= TOLERANCE)
+            largest = shortfalls.max() if len(shortfalls) > 0 else 0
+            print(f'{criterion:16s} {path:>11s} search: {optimal:4d} of {len(shortfalls):4d} optimal, '
+                  f'largest shortfall {largest:.1e}')
+            if path != 'approximate':
+                failed |= optimal != len(shortfalls) or np.any(shortfalls < -TOLERANCE)
+
+    return 1 if failed else 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,10 @@ if __name__ == '__main__':
                     'upper_strain': 0.25,
                     'rel_cutoff_pct': 25,
                     'no_sections': 5,
+                    'section_stride_pct': 100,
+                    'window_min_samples': 50,
+                    'window_min_strain': 0.0,
+                    'window_criterion': 'Highest r2',
                     'smoothing_dynamic': 35,
                     'dynamic_line_divisor': 5}
     # -------------------------------------------parameter definition end-----------------------------------------------
@@ -38,24 +42,24 @@ if __name__ == '__main__':
     df, meta = io_data.load_data(filepath_in, is_percent=True, log=True)
 
     # example call: prepare
-    df_prepro, dict_prepro, figures['preprocessing'] = preprocessing.prepare(df, x_dimensions=1.3, y_dimensions=10.0,
-                                                                             factor=50, smoothing=15, distance=5,
-                                                                             width=5, split_peaks=False,
-                                                                             filter_value=0.005, figsize=(20, 10),
-                                                                             log=True)
+    df_prepro, dict_prepro = preprocessing.prepare(df, x_dimensions=1.3, y_dimensions=10.0, factor=50, smoothing=15,
+                                                   distance=5, width=5, split_peaks=False, filter_value=0.005,
+                                                   log=True)
 
     # example call: get_master_curves
-    dfs_master, figures['master_curves'] = preprocessing.get_master_curves(df_prepro, dict_prepro['hills'],
-                                                                           dict_prepro['valleys'], figsize=(20, 10),
-                                                                           log=True)
+    dfs_master = preprocessing.get_master_curves(df_prepro, dict_prepro['hills'], dict_prepro['valleys'], log=True)
 
     # example call: linear
-    fit_result, figures['fit_full'] = fit.linear(df_prepro, dict_prepro['dfs_grouped'], range_filter, figsize=(20, 10),
-                                                 log=True)
+    fit_result = fit.linear(df_prepro, dict_prepro['cycles'], range_filter, log=True)
 
     # example call: calc
-    hyst_result, figures['hysteresis'] = hysteresis.calc(dict_prepro['dfs_grouped'], smoothing=16, figsize=(20, 10),
-                                                         log=True)
+    hyst_result = hysteresis.calc(dict_prepro['cycles'], smoothing=16, log=True)
+
+    # figures are optional and only built on demand
+    figures['preprocessing'] = preprocessing.plot_prepare(df_prepro, dict_prepro, figsize=(20, 10))
+    figures['master_curves'] = preprocessing.plot_master_curves(dfs_master, figsize=(20, 10), log=True)
+    figures['fit_full'] = fit.plot_linear(df_prepro, fit_result, figsize=(20, 10))
+    figures['hysteresis'] = hysteresis.plot_calc(dict_prepro['cycles'], smoothing=16, figsize=(20, 10))
 
     # build content from previous calls
     content['meta_data'] = meta
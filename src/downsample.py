@@ -0,0 +1,84 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ['LTTB', 'Min-max', 'Off']
+
+# points drawn per pixel of the canvas width
+POINTS_PER_PIXEL = 2
+
+
+def select(x, y, max_points=None, method='LTTB'):
+    # indices of the samples to draw, a slice over all of them if no reduction is needed. Buckets follow the sample
+    # order, so curves that are not monotonic in x (e.g. stress-strain) keep their shape as well
+    if method == 'Off' or not max_points or len(y) <= max_points:
+        return slice(None)
+    if method == 'LTTB':
+        return lttb(x, y, max_points)
+    elif method == 'Min-max':
+        return min_max(y, max_points // 2)
+    raise ValueError(f'Unknown decimation method: {method}')
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: first and last sample plus one sample per bucket in between, the one spanning
+    # the largest triangle with the sample kept in the previous bucket and the mean of the next bucket
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts, x[n - 1])
+    mean_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / counts, y[n - 1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    kept = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        ax, ay = x[kept], y[kept]
+        areas = np.abs((ax - mean_x[i + 1]) * (y[start:stop] - ay) - (ax - x[start:stop]) * (mean_y[i + 1] - ay))
+
+        # NaN samples are only kept if the whole bucket is NaN
+        areas[np.isnan(areas)] = -1
+        kept = start + int(np.argmax(areas))
+        selected[i + 1] = kept
+
+    return selected
+
+
+def min_max(y, n_buckets):
+    # minimum and maximum of every bucket in sample order, the envelope of the curve stays exact at pixel resolution
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_buckets < 1 or 2 * n_buckets >= n:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    rows = -(-n // size)
+    missing = np.isnan(y)
+    low = np.full(rows * size, np.inf)
+    high = np.full(rows * size, -np.inf)
+    low[:n] = np.where(missing, np.inf, y)
+    high[:n] = np.where(missing, -np.inf, y)
+
+    first = np.arange(rows) * size
+    minima = first + low.reshape(rows, size).argmin(axis=1)
+    maxima = first + high.reshape(rows, size).argmax(axis=1)
+    return np.unique(np.concatenate([[0, n - 1], minima, maxima]))
+
+
+def plot(ax, x, y, max_points=None, method='LTTB', **kwargs):
+    x, y = np.asarray(x), np.asarray(y)
+    keep = select(x, y, max_points, method)
+    return ax.plot(x[keep], y[keep], **kwargs)
+
+
+def scatter(ax, x, y, max_points=None, method='LTTB', **kwargs):
+    x, y = np.asarray(x), np.asarray(y)
+    keep = select(x, y, max_points, method)
+    return ax.scatter(x[keep], y[keep], **kwargs)
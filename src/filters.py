@@ -0,0 +1,93 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# scipy is only imported by the kernels using it
+logger = logging.getLogger(__name__)
+
+METHODS = ['Moving average', 'Savitzky-Golay', 'Zero-phase IIR']
+
+# polynomial order of the Savitzky-Golay kernel and order of the low-pass filter
+SAVGOL_ORDER = 2
+IIR_ORDER = 2
+
+
+def smooth(values, window, method='Moving average'):
+    # smoothing of a single channel, the window in samples sets the strength of every method
+    values = np.asarray(values, dtype=np.float64)
+    if method == 'Moving average':
+        return moving_average(values, window)
+    elif method == 'Savitzky-Golay':
+        return savgol(values, window)
+    elif method == 'Zero-phase IIR':
+        return filtfilt(values, window)
+    raise ValueError(f'Unknown smoothing method: {method}')
+
+
+def moving_average(values, window):
+    # centered moving average, pandas' rolling(window, center=True).mean() of the single channel. Its running sums
+    # round exactly like the former rolling mean over the whole DataFrame, a cumulative sum breaks the ties of
+    # quantized signals differently and moves the detected peaks by a sample
+    values = np.asarray(values, dtype=np.float64)
+    if window < 1 or window > len(values):
+        return np.full(len(values), np.nan)
+    return pd.Series(values).rolling(window=window, center=True).mean().values
+
+
+def segment_rolling_mean(values, offsets, window, center=False):
+    # pandas' rolling(window, center=center).mean() of every segment [offsets[i], offsets[i+1]) from cumulative sums.
+    # Windows reaching over a segment border or touching a NaN give NaN, like in pandas
+    counts = np.diff(offsets)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if n == 0 or window < 1:
+        return result
+    position = np.arange(n) - np.repeat(offsets[:-1], counts)
+    lengths = np.repeat(counts, counts)
+
+    # every segment is centered on its mean, so the running sum does not grow across segments
+    missing = np.isnan(values)
+    filled = np.where(missing, 0, values)
+    means = np.zeros(len(counts))
+    means[counts > 0] = np.add.reduceat(filled, offsets[:-1][counts > 0]) / counts[counts > 0]
+    means = np.repeat(means, counts)
+    sums = np.concatenate([[0.0], np.cumsum(filled - means)])
+    nans = np.concatenate([[0], np.cumsum(missing)])
+
+    # trailing windows ending at every sample
+    complete = position >= window - 1
+    end = np.arange(1, n + 1)
+    begin = np.where(complete, end - window, 0)
+    complete &= nans[end] == nans[begin]
+    trailing = np.where(complete, (sums[end] - sums[begin]) / window + means, np.nan)
+    if not center:
+        return trailing
+
+    # a centered window is the trailing window ending (window - 1) // 2 samples later
+    offset = (window - 1) // 2
+    shifted = position + offset < lengths
+    result[shifted] = trailing[np.flatnonzero(shifted) + offset]
+    return result
+
+
+def savgol(values, window, polyorder=SAVGOL_ORDER):
+    # local least-squares polynomial, keeps the height of the peaks better than a moving average of the same window.
+    # The window is made odd and longer than the polynomial order, the borders are fitted instead of left NaN
+    import scipy.signal as signal
+
+    window = max(window | 1, polyorder + 1 + (polyorder % 2 == 0))
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    return signal.savgol_filter(values, window, polyorder, mode='interp')
+
+
+def filtfilt(values, window, order=IIR_ORDER):
+    # Butterworth low-pass run forward and backward, so it adds no phase shift. The cutoff is the -3 dB frequency of
+    # a moving average over the window, 0.443 / window cycles per sample
+    import scipy.signal as signal
+
+    cutoff = min(2 * 0.443 / max(window, 1), 0.99)
+    sos = signal.butter(order, cutoff, output='sos')
+    if len(values) <= 3 * (2 * len(sos) + 1):
+        return np.full(len(values), np.nan)
+    return signal.sosfiltfilt(sos, values)
@@ -1,18 +1,487 @@
+import concurrent.futures
 import logging
-import math
-import matplotlib
-import matplotlib.pyplot as plt
+import numpy as np
+import os
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
+import shutil
+import tempfile
 from statistics import mean
 
-matplotlib.use('Qt5Agg')
+from src import downsample, filters
+
 logger = logging.getLogger(__name__)
 
+# chunks with up to this many candidate intervals are searched exhaustively for 'Best window', in blocks of
+# WINDOW_BLOCK intervals (about 500 samples at the default minimum window). Longer chunks are searched by branch and
+# bound: boxes of intervals are split until they hold at most LEAF_WINDOWS intervals, which are then scored, and
+# dropped once their bound cannot beat the best interval by more than WINDOW_SLACK (relative). The approximate search
+# refining the best REFINED_WINDOWS coarse candidates gives the first best interval
+EXHAUSTIVE_WINDOWS = 2 ** 17
+WINDOW_BLOCK = 2 ** 16
+LEAF_WINDOWS = 256
+WINDOW_SLACK = 1e-9
+REFINED_WINDOWS = 8
+
+# ways to spread the border calculation of the chunks, and the chunks handed to a worker at once
+EXECUTORS = ['serial', 'threads', 'processes']
+BATCH_SIZE = 64
+
+
+def linear(df_in, cycles, range_filter, log=False, executor='serial', workers=None):
+    logger.info(f'Called linear with range_filter: {range_filter}, executor: {executor}')
+
+    cycle_ids, up, max_strain, fit_starts, fit_ends, xs, ys = ([], [], [], [], [], [], [])
+
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+
+    # check if dynamic mode is expected, the filter of every chunk is resolved before any border is calculated
+    jobs = []
+    for group_id in range(len(cycles)):
+        for down, n in enumerate(cycles.halves[group_id]):
+            if n >= 0:
+                jobs.append((group_id, down, n, resolve_filter(range_filter, group_id, down, len(cycles))))
+
+    # 'Point Connect Distance' borders of all chunks using it are found in one call over the concatenated chunks
+    borders = {}
+    chunks = [n for _, _, n, chunk_filter in jobs if chunk_filter['type'] == 'Point Connect Distance']
+    if chunks:
+        offsets = np.concatenate([[0], np.cumsum(cycles.lengths[chunks])]).astype(np.int64)
+        starts, stops = point_connect_borders(np.concatenate([travel[cycles.start[n]:cycles.stop[n]] for n in chunks]),
+                                              np.concatenate([stress[cycles.start[n]:cycles.stop[n]] for n in chunks]),
+                                              offsets, range_filter['smoothing_dynamic'],
+                                              range_filter['dynamic_line_divisor'])
+        borders.update(zip(chunks, zip(starts, stops)))
+
+    # every other chunk is independent work, optionally spread over a pool
+    remaining = [(down, n, chunk_filter) for _, down, n, chunk_filter in jobs if n not in borders]
+    borders.update(zip([n for _, n, _ in remaining], find_borders(cycles, remaining, executor, workers)))
+
+    # collect the fit range of every chunk in cycle order, the fits themselves are evaluated for all chunks at once
+    for group_id, down, n, chunk_filter in jobs:
+        start, stop = borders[n]
+
+        if stop <= start:
+            if log:
+                logger.warning(f'Using full range for {down} in {group_id + 1}, filter erased everything')
+            start, stop = 0, cycles.lengths[n]
+
+        # views of the column buffers, the only copy is the concatenation for segment_fits
+        first, last = cycles.start[n] + start, cycles.start[n] + stop
+        xs.append(travel[first:last])
+        ys.append(stress[first:last])
+        fit_starts.append(cycles.label(first))
+        fit_ends.append(cycles.label(last - 1))
+        cycle_ids.append(group_id + 1)
+
+        # loading chunks report the strain at their end, unloading chunks at their start
+        up.append(cycles.direction[n] > 0)
+        max_strain.append(travel[cycles.stop[n] - 1] if up[-1] else travel[cycles.start[n]])
+
+    offsets = np.concatenate([[0], np.cumsum([len(x) for x in xs])]).astype(np.int64)
+    x = np.concatenate(xs) if xs else np.empty(0)
+    y = np.concatenate(ys) if ys else np.empty(0)
+    slope, intercept, r2 = segment_fits(x, y, offsets)
+
+    # the young modulus is divided by ten not thousand to give GPa because the x-axis is given in %
+    # fit_start/fit_end are the index labels of the fitted range, they allow plotting without refitting
+    params = pd.DataFrame({'Cycle': cycle_ids, 'r2': r2, 'E': slope / 10,
+                           't': intercept, 'max_strain': max_strain,
+                           'fit_start': fit_starts, 'fit_end': fit_ends})
+    up = np.array(up, dtype=bool)
+
+    if log:
+        for n, row in enumerate(params.itertuples()):
+            logger.info(f'Cycle number: {row.Cycle}, Unloading: {int(not up[n])}, r²: {row.r2},'
+                        f' E: {row.E}, t: {row.t}')
+
+    d = {'loading': params[up].reset_index(drop=True), 'unloading': params[~up].reset_index(drop=True)}
+
+    if d['loading'].empty or d['unloading'].empty:
+        logger.warning('Evaluation unsuccessful! Not even one single fit possible')
+    else:
+        logger.info(f'Successfully evaluated linear fit. Mean r²: {mean(params["r2"])}')
+    return d
+
+
+def find_borders(cycles, jobs, executor='serial', workers=None):
+    # fit borders (start, stop relative to the chunk) of every (down, chunk number, filter) job, in the order of jobs.
+    # Jobs are dispatched in batches of BATCH_SIZE chunks. Worker processes get strain and stress as memory-mapped files
+    # instead of pickled DataFrames
+    if executor not in EXECUTORS:
+        raise ValueError(f'Executor "{executor}" was not recognized.')
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+
+    tasks = [(cycles.start[n], cycles.stop[n], down, chunk_filter) for down, n, chunk_filter in jobs]
+    if executor == 'serial' or len(tasks) <= BATCH_SIZE:
+        return chunks_borders(travel, stress, tasks)
+
+    batches = [tasks[i:i + BATCH_SIZE] for i in range(0, len(tasks), BATCH_SIZE)]
+    if executor == 'threads':
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(chunks_borders, [travel] * len(batches), [stress] * len(batches), batches))
+    else:
+        folder = tempfile.mkdtemp(prefix='ctanalyzer_')
+        try:
+            shared = share_columns({'Standard travel': travel, 'Standard stress': stress}, folder)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(borders_batch, [shared] * len(batches), batches))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    # pool.map keeps the order of the batches
+    return [borders for batch in results for borders in batch]
+
+
+def chunks_borders(travel, stress, tasks):
+    # borders of every (start, stop, down, filter) task, the chunks are passed to calc_borders as views
+    return [calc_borders(chunk_filter, down, travel[start:stop], stress[start:stop])
+            for start, stop, down, chunk_filter in tasks]
+
+
+def borders_batch(shared, tasks):
+    # worker side of find_borders
+    columns = open_shared(shared)
+    return chunks_borders(columns['Standard travel'], columns['Standard stress'], tasks)
+
+
+def share_columns(columns, folder):
+    # columns that already are complete memory-mapped files (out_of_core) are passed on by name, all others are
+    # written to a raw float64 file in folder once
+    shared = {}
+    for name, column in columns.items():
+        if isinstance(column, np.memmap) and column.filename is not None and column.offset == 0 and \
+                column.dtype == np.float64 and os.path.getsize(column.filename) == column.nbytes:
+            shared[name] = (column.filename, len(column))
+        else:
+            path_column = os.path.join(folder, f'{len(shared)}.f8')
+            np.ascontiguousarray(column, dtype=np.float64).tofile(path_column)
+            shared[name] = (path_column, len(column))
+    return shared
 
-def linear(df_in, dfs_grouped, range_filter, figsize=(20, 10), log=False):
-    logger.info(f'Called linear with range_filter: {range_filter}')
+
+def open_shared(shared):
+    columns = {}
+    for name, (path_column, n_rows) in shared.items():
+        if n_rows > 0:
+            columns[name] = np.memmap(path_column, dtype=np.float64, mode='r', shape=(n_rows,))
+        else:
+            columns[name] = np.empty(0, dtype=np.float64)
+    return columns
+
+
+def segment_fits(x, y, offsets):
+    # least squares line and r² of every segment [offsets[i], offsets[i+1]) of x and y with numpy reductions instead
+    # of one model per segment. The sums are taken around the segment means, raw sums of x² and xy cancel badly on
+    # strain values far from zero
+    counts = np.diff(offsets)
+    if len(counts) == 0:
+        return np.empty(0), np.empty(0), np.empty(0)
+
+    starts = offsets[:-1]
+    mean_x = np.add.reduceat(x, starts) / counts
+    mean_y = np.add.reduceat(y, starts) / counts
+
+    # sample-sized temporaries are reused in place, they dominate the memory of the fitting stage
+    dx = np.repeat(mean_x, counts)
+    np.subtract(x, dx, out=dx)
+    dy = np.repeat(mean_y, counts)
+    np.subtract(y, dy, out=dy)
+    product = dx * dx
+
+    sxx = np.add.reduceat(product, starts)
+    sxy = np.add.reduceat(np.multiply(dx, dy, out=product), starts)
+    syy = np.add.reduceat(np.multiply(dy, dy, out=product), starts)
+
+    # a segment without strain variation gets a flat line like the minimum norm solution of sklearn
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+    intercept = mean_y - slope * mean_x
+    ss_res = np.maximum(syy - slope * sxy, 0)
+
+    # same conventions as sklearn's r2_score: perfect fits of constant data give 1, r² is undefined below 2 samples
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(syy > 0, 1 - ss_res / syy, np.where(ss_res == 0, 1.0, 0.0))
+    r2[counts < 2] = np.nan
+
+    return slope, intercept, r2
+
+
+def window_r2(x, y, length, starts):
+    # r² of the least squares line through every window [start, start + length), any window costs the same
+    # regardless of its length
+    if length < 2 or len(starts) == 0:
+        return np.full(len(starts), np.nan)
+    return window_scores(prefix_sums(x, y), starts, starts + length)[0]
+
+
+def prefix_sums(x, y):
+    # cumulative sums of x, y, xy, x² and y². Values are centered on the chunk means first, raw sums cancel badly on
+    # strain values far from zero
+    dx = x - x.mean()
+    dy = y - y.mean()
+    return [np.concatenate([[0.0], np.cumsum(values)]) for values in (dx, dy, dx * dx, dx * dy, dy * dy)]
+
+
+def window_scores(sums, starts, stops):
+    # r² and residual sum of squares of the windows [starts, stops) from the prefix sums, r² is undefined below 2
+    # samples. Same conventions as segment_fits: constant stress is a perfect fit, constant strain explains nothing
+    n = (stops - starts).astype(np.float64)
+    sx, sy, sxx, sxy, syy = [cumulative[stops] - cumulative[starts] for cumulative in sums]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cxx = np.maximum(sxx - sx * sx / n, 0)
+        cxy = sxy - sx * sy / n
+        cyy = np.maximum(syy - sy * sy / n, 0)
+        r2 = np.where(cyy > 0, np.where(cxx > 0, cxy * cxy / (cxx * cyy), 0.0), 1.0)
+        ss_res = np.where(cxx > 0, np.maximum(cyy - cxy * cxy / cxx, 0), cyy)
+
+    r2 = np.minimum(r2, 1.0)
+    r2[n < 2] = np.nan
+    return r2, ss_res
+
+
+def best_window(x, y, min_samples, min_strain, criterion):
+    # most linear interval [start, stop) of a chunk with at least min_samples samples and a strain span of at least
+    # min_strain. Every interval is scored in O(1) from prefix sums. Short chunks try all O(n²) intervals, longer ones
+    # are pruned with bounds, both return the optimum (see src/check_window.py)
+    n = len(x)
+    min_samples = max(min_samples, 2)
+    if n < min_samples:
+        return 0, 0
+    sums = prefix_sums(x, y)
+
+    n_windows = (n - min_samples + 1) * (n - min_samples + 2) // 2
+    if n_windows <= EXHAUSTIVE_WINDOWS:
+        start, stop, value = exhaustive_window(x, sums, min_samples, min_strain, criterion)
+    else:
+        start, stop, value = pruned_window(x, sums, min_samples, min_strain, criterion)
+    return start, stop
+
+
+def exhaustive_window(x, sums, min_samples, min_strain, criterion):
+    # every interval, blocks of consecutive starts with all their stops are scored at once. Stops run backwards, so
+    # the longest of several equally scored intervals of a start wins
+    n = len(x)
+    counts = np.arange(n - min_samples + 1, 0, -1, dtype=np.int64)
+    ends = np.cumsum(counts)
+    start, stop, value = 0, 0, -np.inf
+
+    first = 0
+    while first < len(counts):
+        last = max(int(np.searchsorted(ends, ends[first] - counts[first] + WINDOW_BLOCK, side='right')), first + 1)
+        block_counts = counts[first:last]
+        starts = np.repeat(np.arange(first, last, dtype=np.int64), block_counts)
+        stops = n - (np.arange(len(starts)) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts))
+
+        scores = window_objective(x, sums, starts, stops, min_samples, min_strain, criterion)
+        k = np.argmax(scores)
+        if scores[k] > value:
+            start, stop, value = starts[k], stops[k], scores[k]
+        first = last
+
+    return int(start), int(stop), value
+
+
+def pruned_window(x, sums, min_samples, min_strain, criterion):
+    # branch and bound over boxes of intervals, a box (i0, i1, j0, j1) holds the intervals starting in [i0, i1] and
+    # stopping in [j0, j1]. Boxes are halved along their longer side, all boxes of a level at once. Within rounding
+    # of WINDOW_SLACK the optimum, ties keep the interval found first
+    n = len(x)
+    start, stop, value = approximate_window(x, sums, min_samples, min_strain, criterion)
+    if not np.isfinite(value):
+        # without a first interval nothing could be dropped, the one with the widest strain span is admissible if
+        # any interval is
+        start, stop = widest_window(x, min_samples)
+        value = window_objective(x, sums, np.array([start]), np.array([stop]), min_samples, min_strain, criterion)[0]
+        if not np.isfinite(value):
+            return 0, 0, -np.inf
+    boxes = np.array([[0, n - min_samples, min_samples, n]], dtype=np.int64)
+
+    while len(boxes) > 0:
+        # small boxes are scored interval by interval, starts ascending and stops descending
+        counts = (boxes[:, 1] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 2] + 1)
+        leaves = counts <= LEAF_WINDOWS
+        if leaves.any():
+            i0, j1 = boxes[leaves, 0], boxes[leaves, 3]
+            n_stops = boxes[leaves, 3] - boxes[leaves, 2] + 1
+            box = np.repeat(np.arange(len(i0)), counts[leaves])
+            local = np.arange(len(box)) - np.repeat(np.cumsum(counts[leaves]) - counts[leaves], counts[leaves])
+            starts = i0[box] + local // n_stops[box]
+            stops = j1[box] - local % n_stops[box]
+            admissible = stops - starts >= min_samples
+            scores = window_objective(x, sums, starts[admissible], stops[admissible], min_samples, min_strain,
+                                      criterion)
+            if len(scores) > 0 and scores.max() > value:
+                k = np.argmax(scores)
+                start, stop, value = starts[admissible][k], stops[admissible][k], scores[k]
+
+        boxes = boxes[~leaves]
+        i0, i1, j0, j1 = boxes.T
+        halve_starts = (i1 - i0 >= j1 - j0)[:, np.newaxis]
+        middle_starts, middle_stops = (i0 + i1) // 2, (j0 + j1) // 2
+        boxes = np.concatenate([np.where(halve_starts, np.stack([i0, middle_starts, j0, j1], axis=1),
+                                         np.stack([i0, i1, j0, middle_stops], axis=1)),
+                                np.where(halve_starts, np.stack([middle_starts + 1, i1, j0, j1], axis=1),
+                                         np.stack([i0, i1, middle_stops + 1, j1], axis=1))])
+
+        # boxes without an interval of min_samples or without a chance to improve are dropped
+        boxes = boxes[boxes[:, 3] - boxes[:, 0] >= min_samples]
+        boxes = boxes[window_bound(sums, *boxes.T, criterion) > value + WINDOW_SLACK * abs(value)]
+
+    return int(start), int(stop), value
+
+
+def widest_window(x, min_samples):
+    # interval [start, stop) of at least min_samples samples with the largest strain span |x[stop - 1] - x[start]|,
+    # from the largest and smallest strain following every start
+    n = len(x)
+    following_max = np.maximum.accumulate(x[::-1])[::-1][min_samples - 1:]
+    following_min = np.minimum.accumulate(x[::-1])[::-1][min_samples - 1:]
+    rising, falling = following_max - x[:n - min_samples + 1], x[:n - min_samples + 1] - following_min
+    if rising.max() >= falling.max():
+        start = int(np.argmax(rising))
+        return start, start + min_samples + int(np.argmax(x[start + min_samples - 1:]))
+    start = int(np.argmax(falling))
+    return start, start + min_samples + int(np.argmin(x[start + min_samples - 1:]))
+
+
+def window_bound(sums, i0, i1, j0, j1, criterion):
+    # upper bound of window_objective over the intervals starting in [i0, i1] and stopping in [j0, j1]. Each of them
+    # contains [i1, j0) and lies within [i0, j1), the residual sum of squares and the spread of the stress only grow
+    # with the interval, so the inner one bounds the residual from below and the outer one the spread from above
+    inner_stops = np.maximum(j0, i1)
+    ss_inner = np.where(inner_stops - i1 >= 2, window_scores(sums, i1, inner_stops)[1], 0)
+    if criterion == 'Lowest residual':
+        return -ss_inner / np.maximum(j1 - i0 - 2, 1)
+
+    n = (j1 - i0).astype(np.float64)
+    sy, syy = sums[1][j1] - sums[1][i0], sums[4][j1] - sums[4][i0]
+    cyy = np.maximum(syy - sy * sy / n, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cyy > 0, 1 - ss_inner / cyy, 1.0)
+
+
+def approximate_window(x, sums, min_samples, min_strain, criterion):
+    # a coarse scan over windows of doubling length narrows the search, the borders of the best candidates are then
+    # moved with a shrinking step while the score improves. Near-linear, the result can score below the optimum but
+    # lets pruned_window drop most boxes right away
+    n = len(x)
+
+    def score(starts, stops):
+        return window_objective(x, sums, starts, stops, min_samples, min_strain, criterion)
+
+    # coarse scan: each window length is shifted by a quarter of itself
+    starts, stops = [], []
+    length = min_samples
+    while True:
+        window_starts = np.arange(0, n - length + 1, max(length // 4, 1), dtype=np.int64)
+        starts.append(window_starts)
+        stops.append(window_starts + length)
+        if length == n:
+            break
+        length = min(length * 2, n)
+    starts, stops = np.concatenate(starts), np.concatenate(stops)
+
+    def refine(start, stop, value):
+        # try moving either border in both directions, halve the step once no move improves the score
+        step = max((stop - start) // 8, 1)
+        while step >= 1:
+            candidate_starts = np.array([start - step, start + step, start, start])
+            candidate_stops = np.array([stop, stop, stop - step, stop + step])
+            valid = (candidate_starts >= 0) & (candidate_stops <= n) & (candidate_stops > candidate_starts)
+            candidate_scores = np.full(len(valid), -np.inf)
+            candidate_scores[valid] = score(candidate_starts[valid], candidate_stops[valid])
+
+            k = np.argmax(candidate_scores)
+            if candidate_scores[k] > value:
+                start, stop, value = candidate_starts[k], candidate_stops[k], candidate_scores[k]
+            else:
+                step //= 2
+        return start, stop, value
+
+    # the best few coarse candidates are refined, a single one often ends in a local optimum
+    scores = score(starts, stops)
+    start, stop, value = 0, 0, -np.inf
+    for k in np.argsort(-scores, kind='mergesort')[:REFINED_WINDOWS]:
+        if not np.isfinite(scores[k]):
+            break
+        refined = refine(starts[k], stops[k], scores[k])
+        if refined[2] > value:
+            start, stop, value = refined
+
+    return int(start), int(stop), value
+
+
+def window_objective(x, sums, starts, stops, min_samples, min_strain, criterion):
+    # score of the windows [starts, stops) maximized by best_window, -inf for windows violating the constraints
+    r2, ss_res = window_scores(sums, starts, stops)
+    if criterion == 'Lowest residual':
+        value = -ss_res / np.maximum(stops - starts - 2, 1)
+    else:
+        value = r2
+    span = np.abs(x[stops - 1] - x[starts])
+    valid = (stops - starts >= min_samples) & (span >= min_strain) & ~np.isnan(value)
+    return np.where(valid, value, -np.inf)
+
+
+def point_connect_borders(x, y, offsets, smoothing, line_divisor):
+    # fit borders of every segment [offsets[i], offsets[i+1]) of strain x and stress y, returned as start and stop
+    # positions relative to the segment. Each smoothed point is compared with the middle of the line connecting the
+    # smoothed points half a line width behind and ahead of it, the line width being the segment length divided by
+    # line_divisor. The first contiguous section whose (smoothed) distance stays below half of the distance range is
+    # fitted; the full segment is used if that section is the only one
+    counts = np.diff(offsets)
+    n = len(x)
+    position = np.arange(n) - np.repeat(offsets[:-1], counts)
+    lengths = np.repeat(counts, counts)
+
+    x_smooth = filters.segment_rolling_mean(x, offsets, smoothing)
+    y_smooth = filters.segment_rolling_mean(y, offsets, smoothing)
+
+    # same asymmetric shifts as shift(line_width // 2) and shift(-line_width // 2)
+    line_width = np.repeat(counts // line_divisor, counts)
+    behind = line_width // 2
+    ahead = -(-line_width // 2)
+    inside = (position >= behind) & (position + ahead < lengths)
+    first = np.where(inside, np.arange(n) - behind, 0)
+    last = np.where(inside, np.arange(n) + ahead, 0)
+
+    with np.errstate(invalid='ignore'):
+        middle_x = np.where(inside, (x_smooth[last] + x_smooth[first]) / 2, np.nan)
+        middle_y = np.where(inside, (y_smooth[last] + y_smooth[first]) / 2, np.nan)
+    distance = filters.segment_rolling_mean(np.hypot(middle_x - x_smooth, middle_y - y_smooth), offsets, smoothing,
+                                            center=True)
+
+    # half of the distance range of each segment is the cutoff, segments without any distance keep the full range
+    filled = counts > 0
+    cutoff = np.full(len(counts), np.nan)
+    if n > 0:
+        with np.errstate(invalid='ignore'):
+            cutoff[filled] = (np.fmax.reduceat(distance, offsets[:-1][filled]) -
+                              np.fmin.reduceat(distance, offsets[:-1][filled])) / 2
+    with np.errstate(invalid='ignore'):
+        below = distance < np.repeat(cutoff, counts)
+
+    # contiguous sections below the cutoff, starts and ends are matched in order
+    previous = np.concatenate([[False], below[:-1]]) & (position > 0)
+    following = np.concatenate([below[1:], [False]]) & (position < lengths - 1)
+    section_starts = np.flatnonzero(below & ~previous)
+    section_ends = np.flatnonzero(below & ~following)
+    segment = np.searchsorted(offsets, section_starts, side='right') - 1
+
+    starts = np.zeros(len(counts), dtype=np.int64)
+    stops = counts.astype(np.int64)
+    n_sections = np.bincount(segment, minlength=len(counts))
+    segments, first_section = np.unique(segment, return_index=True)
+    several = n_sections[segments] > 1
+    starts[segments[several]] = section_starts[first_section[several]] - offsets[segments[several]]
+    stops[segments[several]] = section_ends[first_section[several]] + 1 - offsets[segments[several]]
+    return starts, stops
+
+
+def plot_linear(df_in, d, figsize=(20, 10), max_points=None, decimation='LTTB'):
+    logger.info(f'Called plot_linear')
+    import matplotlib.pyplot as plt
 
     # init
     fig = plt.figure(figsize=figsize)
@@ -20,187 +489,113 @@ def linear(df_in, dfs_grouped, range_filter, figsize=(20, 10), log=False):
     fig.suptitle('Linear fit results')
     axs[0].set_xlabel('Strain [%]')
     axs[0].set_ylabel('Stress [MPa]')
-    axs[0].plot(df_in['Standard travel'], df_in['Standard stress'], color='grey', linewidth=0.5)
+    downsample.plot(axs[0], df_in['Standard travel'], df_in['Standard stress'], max_points, decimation, color='grey',
+                    linewidth=0.5)
     axs[1].set_xlabel('Maximum Applied Strain [%]')
     axs[1].set_ylabel('E [GPa]')
-    cycle_no = 0
-
-    cycles_up, r2_up, young_modulus_up, t_up, max_strain_up = ([], [], [], [], [])
-    cycles_down, r2_down, young_modulus_down, t_down, max_strain_down = ([], [], [], [], [])
-
-    # linear fitting
-    for group_id, group in enumerate(dfs_grouped):
-
-        cycle_no += 1
-
-        for down, chunk in enumerate(group):
-
-            # check if dynamic mode is expected, calculate borders with different models if True
-            if range_filter['type'] == 'Dynamic':
-                if group_id < len(dfs_grouped) // 3 and down == 0:
-                    range_filter['type'] = 'Top bottom'
-                    df_start_end = calc_borders(range_filter, down, chunk)
-                elif group_id < len(dfs_grouped) // 3 and down == 1:
-                    range_filter['type'] = 'Full range'
-                    df_start_end = calc_borders(range_filter, down, chunk)
-                elif not (group_id < len(dfs_grouped) // 3) and down == 0:
-                    range_filter['type'] = 'Point Connect Distance'
-                    df_start_end = calc_borders(range_filter, down, chunk)
-                elif not (group_id < len(dfs_grouped) // 3) and down == 1:
-                    range_filter['type'] = 'Top bottom'
-                    df_start_end = calc_borders(range_filter, down, chunk)
-                else:
-                    df_start_end = calc_borders(range_filter, down, chunk)
-            else:
-                df_start_end = calc_borders(range_filter, down, chunk)
-
-            if df_start_end.empty:
-                if log:
-                    logger.warning(f'Using full range for {down} in {cycle_no}, filter erased everything')
-                df_start_end = chunk.copy(deep=True)
 
-            fit_start = df_start_end.index[0]
-            fit_end = df_start_end.index[-1]
+    # fit lines in cycle order, reconstructed from slope and intercept over the fitted strain range
+    params = pd.concat([d['loading'], d['unloading']]).sort_values(['Cycle', 'fit_start'], kind='mergesort')
+    for row in params.itertuples():
+        x = df_in['Standard travel'].loc[row.fit_start:row.fit_end]
+        x = np.array([x.min(), x.max()])
+        axs[0].plot(x, x * row.E * 10 + row.t, linewidth=3)
 
-            # build and evaluate model
-            x = chunk[['Standard travel']].loc[fit_start:fit_end]
-            y = chunk[['Standard stress']].loc[fit_start:fit_end]
-
-            model = LinearRegression()
-            model.fit(x, y)
-
-            fit_y = model.predict(x)
-
-            # the young modulus is divided by ten not thousand to give GPa because the x-axis is given in %
-            if chunk['Standard travel'].iloc[0] < chunk['Standard travel'].iloc[-1]:
-                cycles_up.append(cycle_no)
-                r2_up.append(r2_score(y, fit_y))
-                young_modulus_up.append(model.coef_.flat[0] / 10)
-                t_up.append(model.intercept_.flat[0])
-                max_strain_up.append(chunk['Standard travel'].iloc[-1])
-            else:
-                cycles_down.append(cycle_no)
-                r2_down.append(r2_score(y, fit_y))
-                young_modulus_down.append(model.coef_.flat[0] / 10)
-                t_down.append(model.intercept_.flat[0])
-                max_strain_down.append(chunk['Standard travel'].iloc[0])
-
-            if log:
-                logger.info(f'Cycle number: {cycle_no}, Unloading: {down}, r²: {r2_score(y, fit_y)},'
-                            f' E: {model.coef_.flat[0] / 10}, t: {model.intercept_.flat[0]}')
-
-            axs[0].plot(x, fit_y, linewidth=3)
+    # plotting
+    downsample.scatter(axs[1], d['loading']['max_strain'], d['loading']['E'], max_points, decimation, color='navy')
+    downsample.scatter(axs[1], d['unloading']['max_strain'], d['unloading']['E'], max_points, decimation,
+                       color='firebrick')
 
-    params_up = pd.DataFrame({'Cycle': cycles_up, 'r2': r2_up, 'E': young_modulus_up,
-                              't': t_up, 'max_strain': max_strain_up})
+    downsample.plot(axs[1], d['loading']['max_strain'], d['loading']['E'], max_points, decimation, color='slateblue')
+    downsample.plot(axs[1], d['unloading']['max_strain'], d['unloading']['E'], max_points, decimation, color='salmon')
 
-    params_down = pd.DataFrame({'Cycle': cycles_down, 'r2': r2_down, 'E': young_modulus_down,
-                                't': t_down, 'max_strain': max_strain_down})
-    d = {'loading': params_up, 'unloading': params_down}
+    axs[1].legend(['Loading interval', 'Unloading interval'])
 
-    # plotting
-    axs[1].scatter(max_strain_up, young_modulus_up, color='navy')
-    axs[1].scatter(max_strain_down, young_modulus_down, color='firebrick')
+    return fig
 
-    axs[1].plot(max_strain_up, young_modulus_up, color='slateblue')
-    axs[1].plot(max_strain_down, young_modulus_down, color='salmon')
 
-    axs[1].legend(['Loading interval', 'Unloading interval'])
+def resolve_filter(range_filter, group_id, down, n_groups):
+    # 'Dynamic' picks a filter per chunk: the first third of all cycles is fitted with 'Top bottom' on loading and
+    # 'Full range' on unloading, the rest with 'Point Connect Distance' and 'Top bottom'. The caller's dict is
+    # never modified, so the choice is made again for every chunk
+    if range_filter['type'] != 'Dynamic':
+        return range_filter
 
-    if not r2_up or not r2_down:
-        logger.warning('Evaluation unsuccessful! Not even one single fit possible')
+    early = group_id < n_groups // 3
+    if early:
+        range_type = 'Top bottom' if down == 0 else 'Full range'
     else:
-        logger.info(f'Successfully evaluated linear fit. Mean r²: {mean(r2_up+r2_down)}')
-    return d, fig
+        range_type = 'Point Connect Distance' if down == 0 else 'Top bottom'
+    return dict(range_filter, type=range_type)
 
 
-def calc_borders(range_filter, down, chunk):
-    df_range = chunk.copy(deep=True)
+def calc_borders(range_filter, down, travel, stress):
+    # fit borders of one chunk as positions [start, stop) into its strain and stress arrays, (0, 0) if the filter
+    # erased everything. The arrays are only read, so views of the column buffers can be passed without any copy
     range_type = range_filter['type']
+    n = len(travel)
 
     # FILTER: static strain values
     if range_type == 'Static strain':
-        df_range['Travel subtracted'] = abs(df_range['Standard travel'] - df_range.iloc[0, 2])
-        df_start_end = df_range[(df_range['Travel subtracted'] > range_filter['lower_strain']) &
-                                (df_range['Travel subtracted'] < range_filter['upper_strain'])]
+        travel_subtracted = np.abs(travel - travel[0])
+        start, stop = mask_borders((travel_subtracted > range_filter['lower_strain']) &
+                                   (travel_subtracted < range_filter['upper_strain']))
 
     # FILTER: full range
     elif range_type == 'Full range':
-        df_start_end = df_range.copy(deep=True)
+        start, stop = 0, n
 
     # FILTER: top-bottom-cutoff
     elif range_type == 'Top bottom':
-        top = df_range['Standard stress'].max()
-        bottom = df_range['Standard stress'].min()
+        top = np.nanmax(stress)
+        bottom = np.nanmin(stress)
         cutoff = (top-bottom)*(range_filter['rel_cutoff_pct']/100)
         cut_top = top - cutoff
         cut_bottom = bottom + cutoff
-        df_start_end = df_range[(df_range['Standard stress'] > cut_bottom) & (df_range['Standard stress'] < cut_top)]
+        start, stop = mask_borders((stress > cut_bottom) & (stress < cut_top))
 
     # FILTER: best of many sections
     elif range_type == 'Sectioned best':
-        # split chunk into x sections (e.g. 5)
-        sections = []
-        section_size = len(chunk) // range_filter['no_sections']
-        for i in range(0, len(chunk), section_size):
-            section = df_range.iloc[i:i+section_size]
-            if len(section) == section_size:
-                sections.append(section)
-
-        # linear fit each subsection fully contained in the first half of the section and determine best r2 score
+        # windows of a fixed length (chunk length / number of sections) advance by a stride in percent of that
+        # length, 100 % gives the original non-overlapping sections. Only windows fully contained in the first half of
+        # the sections (loading) or behind the middle section (unloading) are candidates
+        section_size = n // range_filter['no_sections']
+        stride = max(section_size * range_filter['section_stride_pct'] // 100, 1)
+        n_sections = n // section_size if section_size > 0 else 0
         if down == 0:
-            sections_filtered = sections[:(len(sections)//2)]
+            lower, upper = 0, (n_sections // 2) * section_size
         else:
-            sections_filtered = sections[(len(sections)//2)+1:]
-
-        r2_best, best_section = (0, 0)
-        for section in sections_filtered:
-            x = section[['Standard travel']]
-            y = section[['Standard stress']]
-
-            model = LinearRegression()
-            model.fit(X=x, y=y)
-            fit_y = model.predict(X=x)
-
-            r2 = r2_score(y, fit_y)
-
-            if r2 > r2_best:
-                best_section = section
-                r2_best = r2
-
-        df_start_end = best_section
+            lower, upper = (n_sections // 2 + 1) * section_size, n_sections * section_size
+        starts = np.arange(lower, upper - section_size + 1, stride, dtype=np.int64)
+
+        # every window is scored in O(1), the first window with the best r² above zero wins
+        r2 = window_r2(travel, stress, section_size, starts)
+        scores = np.where(np.isnan(r2), 0, r2)
+        start, stop = 0, 0
+        if len(scores) > 0 and scores.max() > 0:
+            start = starts[np.argmax(scores)]
+            stop = start + section_size
+
+    # FILTER: most linear interval of a minimum length and strain span
+    elif range_type == 'Best window':
+        start, stop = best_window(travel, stress, range_filter['window_min_samples'],
+                                  range_filter['window_min_strain'], range_filter['window_criterion'])
 
     # FILTER: dynamic determination
     elif range_type == 'Point Connect Distance':
-        # smooth and get line width from total length
-        df_r = df_range.rolling(window=range_filter['dynamic_smoothing']).mean()
-        line_width = len(df_r) // range_filter['dynamic_line_divisor']
-
-        # start/end points of line, generate the middle of line points
-        start_points = df_r.shift(line_width//2)
-        end_points = df_r.shift(-line_width//2)
-        generated_points = pd.DataFrame(
-            {'Standard stress': (end_points['Standard stress'] + start_points['Standard stress'])/2,
-             'Standard travel': (end_points['Standard travel'] + start_points['Standard travel'])/2})
-
-        # calculate delta x, delta y, distance and distance square root according to pythagoras theorem
-        df_r['delta_x'] = abs(generated_points['Standard travel']-df_r['Standard travel'])
-        df_r['delta_y'] = abs(generated_points['Standard stress']-df_r['Standard stress'])
-        df_r['distance'] = df_r['delta_x']**2 + df_r['delta_y']**2
-        df_r['distancesqrt'] = df_r['distance'].map(math.sqrt).rolling(window=range_filter['dynamic_smoothing'],
-                                                                       center=True).mean()
-
-        # apply a half of the maximum/minimum diff cutoff to the distance square root, choose first complacent section
-        max_min_diff = df_r['distancesqrt'].max()-df_r['distancesqrt'].min()
-        df_r_filter = df_r[df_r['distancesqrt'] < max_min_diff/2]
-        df_jumps = df_r_filter[df_r_filter.index.to_series().diff() > 1]
-
-        if len(df_jumps) > 0:
-            df_start_end = df_r_filter.loc[0:df_jumps.index[0]-1]
-        else:
-            df_start_end = df_r
+        starts, stops = point_connect_borders(travel, stress, np.array([0, n]), range_filter['smoothing_dynamic'],
+                                              range_filter['dynamic_line_divisor'])
+        start, stop = starts[0], stops[0]
 
     else:
         raise ValueError(f'Input "{range_filter}" was not recognized.')
 
-    return df_start_end
+    return int(start), int(stop)
+
+
+def mask_borders(mask):
+    # the fit runs from the first to the last selected sample, gaps in between are fitted as well
+    selected = np.flatnonzero(mask)
+    if len(selected) == 0:
+        return 0, 0
+    return selected[0], selected[-1] + 1
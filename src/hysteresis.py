@@ -1,56 +1,112 @@
 import logging
-import matplotlib
-import matplotlib.pyplot as plt
-import pandas as pd
-from scipy.integrate import trapz
+import numpy as np
+
+from src import downsample, filters
 
-matplotlib.use('Qt5Agg')
 logger = logging.getLogger(__name__)
 
 
-def calc(dfs_grouped, smoothing=16, figsize=(20, 10), log=False):
+def calc(cycles, smoothing=16, log=False):
     logger.info('Called calc')
 
+    # init
+    hyst_integrals = {}
+    E_loading = {}
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+
+    # smoothed branches of all cycles with both halves, integrated at once with segment reductions
+    numbers, x, y, offsets = smooth_loops(cycles, smoothing)
+    branch_integrals = segment_trapz(x, y, offsets)
+
+    # integral along the straight line closing the loop from the first loading to the last unloading point
+    first, last = offsets[0:-1:2], offsets[2::2] - 1
+    additional_integrals = (x[last] - x[first]) * (y[last] + y[first]) / 2.0
+    integrals = branch_integrals[0::2] + branch_integrals[1::2] - additional_integrals
+
+    # secant modulus of the raw loading branch
+    loading = cycles.halves[numbers, 0]
+    first, last = cycles.start[loading], cycles.stop[loading] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moduli = ((stress[last] - stress[first]) / (travel[last] - travel[first])) / 10
+
+    # the young modulus is divided by ten not thousand to give GPa because the x-axis is given in %
+    for nr, integral, modulus in zip(numbers + 1, integrals, moduli):
+        if log:
+            logger.info(f'Full integral: {integral}')
+        hyst_integrals[str(nr)] = [integral]
+        E_loading[str(nr)] = modulus
+
+    results = {'areas': hyst_integrals, 'E_loading': E_loading}
+
+    logger.info(f'Successfully calculated hysteresis: {len(hyst_integrals)} areas')
+    return results
+
+
+def plot_calc(cycles, smoothing=16, figsize=(20, 10), max_points=None, decimation='LTTB'):
+    logger.info('Called plot_calc')
+    import matplotlib.pyplot as plt
+
     # init
     fig = plt.figure(figsize=figsize)
     ax = fig.add_subplot()
     ax.set_xlabel('Strain [%]')
     ax.set_ylabel('Stress [MPa]')
     ax.set_title('Hysteresis results')
-    nr = 0
-    hyst_integrals = {}
-    E_loading = {}
 
-    # calculate hysteresis integral and loading E module
-    for group in dfs_grouped:
+    # loading and unloading branch are neighbours in the buffer, the loop is closed by repeating its end points
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+    numbers, x, y, offsets = smooth_loops(cycles, smoothing)
+    for n, nr in enumerate(numbers):
+        start, stop = offsets[2 * n], offsets[2 * n + 2]
+        downsample.plot(ax, np.append(x[start:stop], [x[start], x[stop - 1]]),
+                        np.append(y[start:stop], [y[start], y[stop - 1]]), max_points, decimation)
+        end = cycles.stop[cycles.halves[nr, 0]] - 1
+        ax.annotate(nr + 1, xy=(travel[end], stress[end]))
 
-        nr += 1
-        if len(group) != 2:
-            continue
-        loading = group[0].rolling(window=smoothing, center=True).mean().dropna()
-        unloading = group[1].rolling(window=smoothing, center=True).mean().dropna()
-        additional = pd.concat([loading.iloc[[0]], unloading.iloc[[-1]]])
+    return fig
 
-        loading_integral = trapz(loading['Standard stress'], x=loading['Standard travel'])
-        unloading_integral = trapz(unloading['Standard stress'], x=unloading['Standard travel'])
-        additional_integral = trapz(additional['Standard stress'], x=additional['Standard travel'])
-        integral = loading_integral + unloading_integral - additional_integral
 
-        if log:
-            logger.info(f'Full integral: {integral}')
+def smooth_loops(cycles, smoothing):
+    # centered rolling mean of both branches of every cycle with both halves, like rolling(center=True).mean()
+    # followed by dropna() on each chunk. Returns the 0-based cycle numbers and the smoothed strain and stress of all
+    # branches in one buffer, branch 2n (loading) and 2n + 1 (unloading) of the n-th cycle spanning
+    # [offsets[2n], offsets[2n + 1]) and [offsets[2n + 1], offsets[2n + 2])
+    travel, stress = cycles.columns['Standard travel'], cycles.columns['Standard stress']
+    numbers = cycles.complete()
+    chunks = cycles.halves[numbers].ravel()
 
-        df_cycle = pd.concat([loading, unloading, additional])
-        ax.plot(df_cycle['Standard travel'], df_cycle['Standard stress'])
-        ax.annotate(nr, xy=(group[0].iloc[-1, 2], group[0].iloc[-1, -1]))
+    offsets = np.concatenate([[0], np.cumsum(cycles.lengths[chunks])]).astype(np.int64)
+    x = np.concatenate([travel[cycles.start[n]:cycles.stop[n]] for n in chunks]) if len(chunks) else np.empty(0)
+    y = np.concatenate([stress[cycles.start[n]:cycles.stop[n]] for n in chunks]) if len(chunks) else np.empty(0)
+    x = filters.segment_rolling_mean(x, offsets, smoothing, center=True)
+    y = filters.segment_rolling_mean(y, offsets, smoothing, center=True)
 
-        dy_loading = group[0]['Standard stress'].iloc[-1] - group[0]['Standard stress'].iloc[0]
-        dx_loading = group[0]['Standard travel'].iloc[-1] - group[0]['Standard travel'].iloc[0]
+    # the smoothing leaves NaN at the borders of every branch, they are dropped
+    kept = ~(np.isnan(x) | np.isnan(y))
+    segment = np.repeat(np.arange(len(chunks)), np.diff(offsets))
+    counts = np.bincount(segment[kept], minlength=len(chunks)).reshape(-1, 2)
 
-        # the young modulus is divided by ten not thousand to give GPa because the x-axis is given in %
-        hyst_integrals[str(nr)] = [integral]
-        E_loading[str(nr)] = (dy_loading / dx_loading) / 10
+    # cycles with a branch shorter than the smoothing window have no loop to integrate
+    complete = (counts > 0).all(axis=1)
+    if not complete.all():
+        logger.warning(f'Skipping cycles {list(numbers[~complete] + 1)}, a branch is shorter than the smoothing')
+        kept &= np.repeat(complete, 2)[segment]
+        numbers, counts = numbers[complete], counts[complete]
 
-    results = {'areas': hyst_integrals, 'E_loading': E_loading}
+    offsets = np.concatenate([[0], np.cumsum(counts.ravel())]).astype(np.int64)
+    return numbers, x[kept], y[kept], offsets
 
-    logger.info(f'Successfully calculated hysteresis: {len(hyst_integrals)} areas')
-    return results, fig
+
+def segment_trapz(x, y, offsets):
+    # trapezoidal integral of y over x of every segment [offsets[i], offsets[i+1]), same terms as numpy's trapz.
+    # The term linking the last sample of a segment to the first of the next one is zeroed
+    integrals = np.zeros(len(offsets) - 1)
+    filled = np.diff(offsets) > 0
+    if len(x) == 0:
+        return integrals
+
+    terms = np.zeros(len(x))
+    terms[:-1] = np.diff(x) * (y[1:] + y[:-1]) / 2.0
+    terms[offsets[1:][filled] - 1] = 0
+    integrals[filled] = np.add.reduceat(terms, offsets[:-1][filled])
+    return integrals
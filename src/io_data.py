@@ -1,27 +1,85 @@
+import bz2
 import datetime
+import gzip
+import hashlib
+import io
+import locale
 import logging
 import json
+import lzma
+import numpy as np
 import os
 import pandas as pd
 import re
+import tempfile
+import time
 
 logger = logging.getLogger(__name__)
 
+# the export files are written in the platform encoding, the body is parsed block-wise from the raw bytes
+ENCODING = locale.getpreferredencoding(False)
+CHUNK_BYTES = 16 * 1024 * 1024
 
-def load_data(path_to_file, is_percent=True, log=False):
+# compressed exports are decompressed while streaming, the ratio only sizes the first column buffer
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open, '.lzma': lzma.open}
+COMPRESSION_RATIO = 4
+
+# bump the version whenever the stored layout changes, old entries then simply stop matching
+CACHE_VERSION = 1
+CACHE_MB = 2048
+# temporary cache files older than this were left behind by a crashed write
+STALE_SECONDS = 24 * 60 * 60
+
+
+def load_data(path_to_file, is_percent=True, log=False, chunk_bytes=CHUNK_BYTES):
     logger.info('Called load_data')
 
     # return empty if empty
-    if os.stat(path_to_file).st_size == 0:
+    file_size = os.stat(path_to_file).st_size
+    if file_size == 0:
         return pd.DataFrame(), {}
 
-    # get metadata from file
-    with open(path_to_file, 'r') as input_file:
-        content = input_file.readlines()
+    # header and body are parsed in one pass over the same file handle
+    with open_input(path_to_file) as input_file:
+        meta, names = read_header(input_file)
+
+        if strip_compression(path_to_file) != path_to_file:
+            file_size *= COMPRESSION_RATIO
+        rows_hint = estimate_rows(file_size - input_file.tell(), input_file)
+        columns = read_body(input_file, len(names), rows_hint=rows_hint, chunk_bytes=chunk_bytes)
+
+    # the column-major buffer becomes the DataFrame block without another copy
+    df = pd.DataFrame(columns.T, columns=names)
+
+    if not is_percent:
+        df['Standard travel'] = df['Standard travel'] * 100
+        if log:
+            logger.info('Converted the strain to percent by multiplying with 100')
+
+    logger.info(f'Read in file: {path_to_file}')
+    return df, meta
+
+
+def open_input(path_to_file):
+    # binary handle on the decompressed content, chosen by the file extension
+    extension = os.path.splitext(path_to_file)[1].lower()
+    return OPENERS.get(extension, open)(path_to_file, 'rb')
+
 
-        # lines [0-2] = metadata, [3-4] = units
-        metadata = ''.join(content[:3]).replace('\"', '')
-        units = ''.join(content[3:5]).replace('\"', '')
+def strip_compression(path_to_file):
+    root, extension = os.path.splitext(path_to_file)
+    return root if extension.lower() in OPENERS else path_to_file
+
+
+def read_header(input_file):
+    header = [input_file.readline().decode(ENCODING).rstrip('\r\n') + '\n' for _ in range(5)]
+    return parse_header(header)
+
+
+def parse_header(header):
+    # lines [0-2] = metadata, [3-4] = units
+    metadata = ''.join(header[:3]).replace('\"', '')
+    units = ''.join(header[3:5]).replace('\"', '')
 
     # split at tabs and newlines
     metadata = re.split('[\t\n]', metadata)
@@ -35,21 +93,296 @@ def load_data(path_to_file, is_percent=True, log=False):
     variables.append('Standard stress [MPa]')
     meta['columns'] = variables
 
-    # get the actual data from file
-    df = pd.read_csv(path_to_file, sep='\t',
-                     header=0, names=[units[i] for i in range(0, 4)],
-                     skiprows=4, index_col=False,
-                     decimal=',')
+    return meta, [units[i] for i in range(0, 4)]
 
-    if not is_percent:
-        df['Standard travel'] = df['Standard travel'] * 100
-        if log:
-            logger.info('Converted the strain to percent by multiplying with 100')
 
-    logger.info(f'Read in file: {path_to_file}')
+def estimate_rows(body_bytes, input_file):
+    # guess the row count from the length of the first body line, the column buffers grow if this is too small
+    position = input_file.tell()
+    sample = input_file.read(4096)
+    input_file.seek(position)
+
+    line_length = sample.find(b'\n') + 1
+    if line_length <= 0:
+        return 1
+    return int(body_bytes / line_length * 1.05) + 1
+
+
+def read_body(input_file, n_columns, rows_hint=1, chunk_bytes=CHUNK_BYTES):
+    # stream the tab separated, decimal comma body block-wise into preallocated column arrays
+    columns = np.empty((n_columns, max(rows_hint, 1)), dtype=np.float64)
+    n_rows = 0
+
+    for values in iter_body(input_file, n_columns, chunk_bytes=chunk_bytes):
+        columns, n_rows = append_rows(columns, n_rows, values)
+
+    return trim_columns(columns, n_rows)
+
+
+def iter_body(input_file, n_columns, chunk_bytes=CHUNK_BYTES):
+    remainder = b''
+
+    while True:
+        block = input_file.read(chunk_bytes)
+        if not block:
+            break
+
+        # only parse complete lines, the tail is carried over to the next block
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        remainder = block[cut:]
+        yield parse_block(block[:cut], n_columns)
+
+    if remainder.strip():
+        yield parse_block(remainder, n_columns)
+
+
+def parse_block(block, n_columns):
+    if not block.strip():
+        return np.empty((0, n_columns), dtype=np.float64)
+
+    try:
+        return parse_block_fixed(block, n_columns)
+    except ValueError:
+        logger.info('Block does not match the fixed float layout, falling back to the general parser')
+
+    df_block = pd.read_csv(io.BytesIO(block), sep='\t',
+                           header=None, names=list(range(n_columns)),
+                           index_col=False, decimal=',')
+    return df_block.values.astype(np.float64)
+
+
+def parse_block_fixed(block, n_columns):
+    # the machine layout is known up front: n float columns, no missing values, so type inference and the NA scan
+    # are skipped; both paths share the same float converter and give identical values for identical input. The
+    # tokenizer dominates, this is at most about 10-20 % faster than the general parser (benchmarks/parse.py)
+    df_block = pd.read_csv(io.BytesIO(block), sep='\t',
+                           header=None, names=list(range(n_columns)),
+                           index_col=False, decimal=',',
+                           dtype=np.float64, na_filter=False,
+                           engine='c')
+    return df_block.values
+
+
+def append_rows(columns, n_rows, values):
+    n_new = len(values)
+    if n_rows + n_new > columns.shape[1]:
+        grown = np.empty((columns.shape[0], max(int(columns.shape[1] * 1.5), n_rows + n_new)), dtype=np.float64)
+        grown[:, :n_rows] = columns[:, :n_rows]
+        columns = grown
+
+    columns[:, n_rows:n_rows + n_new] = values.T
+    return columns, n_rows + n_new
+
+
+def trim_columns(columns, n_rows):
+    # the DataFrame keeps the whole buffer alive, so the room left by the row estimate and the growth is given back.
+    # The columns move to the front and the buffer shrinks in place, a trimmed copy would double the peak memory
+    n_columns, capacity = columns.shape
+    if n_rows == capacity:
+        return columns
+    if not columns.flags.owndata:
+        return columns[:, :n_rows].copy()
+
+    flat = columns.reshape(-1)
+    for k in range(1, n_columns):
+        flat[k * n_rows:(k + 1) * n_rows] = flat[k * capacity:k * capacity + n_rows]
+    del flat
+    columns.resize((n_columns, n_rows), refcheck=False)
+    return columns
+
+
+class TailReader:
+    # incremental reader for files that are still written by the testing machine, every poll only parses the
+    # complete lines appended since the previous one
+    def __init__(self, path_to_file, is_percent=True, chunk_bytes=CHUNK_BYTES):
+        self.path_to_file = path_to_file
+        self.is_percent = is_percent
+        self.chunk_bytes = chunk_bytes
+        self.reset()
+
+    def reset(self):
+        self.meta, self.names = {}, []
+        self.offset = 0
+        self.n_rows = 0
+        self.columns = np.empty((4, 0), dtype=np.float64)
+
+    def poll(self):
+        # a file that shrank was replaced, start over
+        if os.stat(self.path_to_file).st_size < self.offset:
+            logger.warning(f'{self.path_to_file} shrank, reading it again from the start')
+            self.reset()
+
+        with open(self.path_to_file, 'rb') as input_file:
+            input_file.seek(self.offset)
+
+            if not self.names:
+                # the header is only parsed once all five lines are complete
+                header = [input_file.readline() for _ in range(5)]
+                if not all(line.endswith(b'\n') for line in header):
+                    return self.empty_batch()
+                self.meta, self.names = parse_header([line.decode(ENCODING).rstrip('\r\n') + '\n'
+                                                      for line in header])
+                self.columns = np.empty((len(self.names), 0), dtype=np.float64)
+                self.offset = input_file.tell()
+
+            values, consumed = read_complete_lines(input_file, len(self.names), self.chunk_bytes)
+
+        self.offset += consumed
+        if not self.is_percent:
+            values[:, self.names.index('Standard travel')] *= 100
+
+        start = self.n_rows
+        self.columns, self.n_rows = append_rows(self.columns, self.n_rows, values)
+
+        return pd.DataFrame(values, columns=self.names, index=pd.RangeIndex(start, self.n_rows))
+
+    def empty_batch(self):
+        return pd.DataFrame(np.empty((0, len(self.names))), columns=self.names)
+
+    def frame(self):
+        # all samples read so far, a view on the growing buffer
+        return pd.DataFrame(self.columns[:, :self.n_rows].T, columns=self.names)
+
+
+def read_complete_lines(input_file, n_columns, chunk_bytes=CHUNK_BYTES):
+    # a partial last line is left in the file for the next poll
+    blocks, consumed, remainder = [], 0, b''
+
+    while True:
+        block = input_file.read(chunk_bytes)
+        if not block:
+            break
+
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        remainder = block[cut:]
+        consumed += cut
+        blocks.append(parse_block(block[:cut], n_columns))
+
+    if not blocks:
+        return np.empty((0, n_columns), dtype=np.float64), 0
+    return np.concatenate(blocks), consumed
+
+
+def load_cached(path_to_file, cache_dir, is_percent=True, max_mb=CACHE_MB, log=False):
+    logger.info('Called load_cached')
+
+    if os.stat(path_to_file).st_size == 0:
+        return pd.DataFrame(), {}
+
+    key = cache_key(path_to_file, is_percent)
+    path_columns = os.path.join(cache_dir, f'{key}.npy')
+    path_meta = os.path.join(cache_dir, f'{key}.json')
+
+    # hit: map the stored columns instead of parsing the text again
+    if os.path.isfile(path_columns) and os.path.isfile(path_meta):
+        try:
+            with open(path_meta, 'r') as file:
+                cached = json.load(file)
+            columns = np.load(path_columns, mmap_mode='c')
+        except (OSError, ValueError):
+            logger.warning(f'Cache entry {key} is unreadable, parsing the file again')
+        else:
+            # touching the entry keeps it at the young end of the LRU order
+            os.utime(path_columns)
+            if log:
+                logger.info(f'Loaded {path_to_file} from cache entry {key}')
+            return pd.DataFrame(columns.T, columns=cached['names']), cached['meta']
+
+    df, meta = load_data(path_to_file, is_percent=is_percent, log=log)
+    if df.empty:
+        return df, meta
+
+    store_cached(cache_dir, key, df, meta)
+    evict_cached(cache_dir, max_mb * 1024 * 1024, keep=key)
+
     return df, meta
 
 
+def cache_key(path_to_file, is_percent):
+    # path, size and modification time identify the file; the strain unit conversion changes the stored columns
+    stat = os.stat(path_to_file)
+    identity = f'{CACHE_VERSION}|{os.path.abspath(path_to_file)}|{stat.st_size}|{stat.st_mtime_ns}|{bool(is_percent)}'
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def store_cached(cache_dir, key, df, meta):
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # the columns are put in place first, the metadata completes the entry. A crashed write never looks like a valid
+    # entry and eviction never takes the columns of a write in progress for an orphan
+    columns = np.ascontiguousarray(df.values.T, dtype=np.float64)
+    content = json.dumps({'names': list(df.columns), 'meta': meta}).encode('utf-8')
+    if replace_written(os.path.join(cache_dir, f'{key}.npy'), lambda file: np.save(file, columns)) and \
+            replace_written(os.path.join(cache_dir, f'{key}.json'), lambda file: file.write(content)):
+        logger.info(f'Stored cache entry {key}')
+
+
+def replace_written(path, write):
+    # write into a temporary file of its own, parallel batch workers may store the same key at once, then move it
+    # over path in one step. False if path cannot be replaced, e.g. while another process maps it on Windows; the
+    # entry there was stored from the same file
+    descriptor, path_tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                            dir=os.path.dirname(path))
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            write(file)
+        os.replace(path_tmp, path)
+    except OSError:
+        logger.warning(f'Could not store {path}')
+        return False
+    finally:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+    return True
+
+
+def evict_cached(cache_dir, max_bytes, keep=None):
+    # every entry with the sizes of its files, an entry is complete with both its .npy and its .json. Temporary
+    # files belong to writes in progress and are left alone unless a crash left them behind long ago
+    entries = {}
+    for name in os.listdir(cache_dir):
+        key, extension = os.path.splitext(name)
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+            if extension == '.tmp' and time.time() - stat.st_mtime > STALE_SECONDS:
+                os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        if extension not in ['.npy', '.json']:
+            continue
+        files, mtime = entries.get(key, ({}, 0))
+        files[name] = stat.st_size
+        entries[key] = (files, stat.st_mtime if extension == '.npy' else mtime)
+
+    # a .json without its .npy is left over from an eviction and never hit, these go first and regardless of the
+    # size. A .npy without its .json may be a write in progress and is evicted like any entry. Then least recently
+    # used entries are dropped until the cache fits, never the one just written
+    def orphan(key):
+        return f'{key}.npy' not in entries[key][0]
+
+    total = sum(sum(files.values()) for files, mtime in entries.values())
+    for key in sorted(entries, key=lambda key: (not orphan(key), entries[key][1])):
+        files, mtime = entries[key]
+        if total <= max_bytes and not orphan(key):
+            break
+        if key == keep:
+            continue
+
+        # the .npy goes first, without it the entry is no longer valid and a left over .json is removed as an
+        # incomplete entry next time
+        for name in sorted(files, key=lambda name: not name.endswith('.npy')):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                # entries that are still mapped cannot be removed on every platform, retry on the next store
+                break
+            total -= files[name]
+        else:
+            logger.info(f'Evicted cache entry {key}')
+
+
 def save_data(folder_out, content, figures, sample_name=None, log=False):
     logger.info('Called save_data')
 
@@ -89,18 +422,31 @@ def save_data(folder_out, content, figures, sample_name=None, log=False):
                 json.dump(subcontent, file, indent=4)
                 if log:
                     logger.info(f'Saved {key}.json')
-        elif key is 'master_results':
+        elif key == 'master_results':
             for axes, data in subcontent.items():
                 data.to_csv(os.path.join(master_dir, f'{axes}.TXT'), sep='\t')
-        elif key is 'fit_results':
+        elif key == 'fit_results':
             for axes, data in subcontent.items():
                 data.to_csv(os.path.join(specimen_dir, f'{axes}.TXT'), sep='\t')
-        elif key is 'dict_prepro':
+        elif key == 'rainflow_results':
+            for signal, data in subcontent.items():
+                data.to_csv(os.path.join(specimen_dir, f'rainflow_{signal}.TXT'), sep='\t', index=False)
+        elif key == 'phase_results':
+            # the matrices are kept binary in single precision, the summaries as text
+            matrix = subcontent['matrix']
+            np.savez_compressed(os.path.join(specimen_dir, 'phase_matrix.npz'), cycles=matrix['cycles'],
+                                phase=matrix['phase'],
+                                **{f'{half}_{name.split()[-1]}': matrix[half][name]
+                                   for half in ['loading', 'unloading'] for name in matrix[half]})
+            for name in ['mean_loop', 'deviation', 'master_curves']:
+                subcontent[name].to_csv(os.path.join(specimen_dir, f'phase_{name}.TXT'), sep='\t', index=False)
+        elif key == 'dict_prepro':
             for name, data in subcontent.items():
                 if isinstance(data, pd.DataFrame) or isinstance(data, pd.Series):
                     data.to_csv(os.path.join(df_dir, f'{name}.TXT'), sep='\t')
-                if name is 'dfs_chunks':
-                    for n, i in enumerate(data):
-                        i.to_csv(os.path.join(df_dir, f'{n}.TXT'), sep='\t')
+                if name == 'cycles':
+                    data.to_frame().to_csv(os.path.join(df_dir, 'cycles.TXT'), sep='\t')
+                    for n in range(len(data.start)):
+                        data.chunk(n).to_csv(os.path.join(df_dir, f'{n}.TXT'), sep='\t')
 
     logger.info(f'Saved!')
@@ -0,0 +1,251 @@
+import argparse
+import logging
+import math
+import numpy as np
+import os
+import pandas as pd
+import sys
+import time
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import analysis_settings, fit, hysteresis, io_data, preprocessing
+
+logger = logging.getLogger(__name__)
+
+
+class CycleMonitor:
+    # incremental evaluation of a running test. Samples are pushed batch-wise (e.g. from io_data.TailReader), turning
+    # points are detected online on the trailing mean of the strain and every completed cycle (valley, hill, valley)
+    # is fitted and integrated on its own samples only. A CUSUM on the loading modulus and a threshold on its drop
+    # below the baseline emit events, both in O(1) per cycle
+    def __init__(self, range_filter, x_dimensions=1.3, y_dimensions=10.0, smoothing=15, gate=0.01,
+                 smoothing_hyst=16, baseline=20, drift=0.5, threshold=5.0, drop_pct=10.0, on_event=None):
+        self.range_filter = range_filter
+        self.geometry = x_dimensions * y_dimensions
+        self.smoothing = smoothing
+        self.gate = gate
+        self.smoothing_hyst = smoothing_hyst
+        self.baseline = baseline
+        self.drift = drift
+        self.threshold = threshold
+        self.drop_pct = drop_pct
+        self.on_event = on_event
+
+        # samples since the start of the running cycle, origin is the global number of the first one
+        self.origin = 0
+        self.travel = np.empty(0)
+        self.stress = np.empty(0)
+        self.n_samples = 0
+
+        # turning point detection: direction 0 = unknown, extremes of the trailing mean and their sample numbers
+        self.direction = 0
+        self.high, self.high_at = -math.inf, 0
+        self.low, self.low_at = math.inf, 0
+        self.cycle_start = 0
+        self.hill = None
+        self.n_cycles = 0
+
+        # baseline statistics (Welford), reference level of the first baseline and CUSUM of the loading modulus
+        self.n_baseline, self.mean, self.m2 = 0, 0.0, 0.0
+        self.reference = None
+        self.cusum = 0.0
+        self.dropped = False
+
+        self.rows = []
+        self.events = []
+
+    def push(self, batch):
+        # returns the events raised by the cycles completed in this batch
+        if batch.empty:
+            return []
+        n_events = len(self.events)
+
+        travel = batch['Standard travel'].values.astype(np.float64)
+        stress = batch['Standard force'].values.astype(np.float64) / self.geometry
+        self.travel = np.concatenate([self.travel, travel])
+        self.stress = np.concatenate([self.stress, stress])
+
+        # trailing mean of the new samples, the buffer always holds the samples of the previous window
+        first = self.n_samples - self.origin
+        self.n_samples += len(batch)
+        cumulative = np.concatenate([[0.0], np.cumsum(self.travel)])
+        end = np.arange(first + 1, len(self.travel) + 1)
+        smooth = (cumulative[end] - cumulative[np.maximum(end - self.smoothing, 0)]) / self.smoothing
+        smooth[self.origin + end < self.smoothing] = np.nan
+
+        # the extreme of a trailing mean lags (smoothing - 1) // 2 samples behind the one of a centered mean
+        lag = (self.smoothing - 1) // 2
+        for n, value in zip(range(self.origin + first, self.n_samples), smooth.tolist()):
+            if value != value:
+                continue
+            if value > self.high:
+                self.high, self.high_at = value, n
+            if value < self.low:
+                self.low, self.low_at = value, n
+
+            # the first move only sets the direction, the start of the test is no turning point
+            if self.direction == 0:
+                if self.high - value > self.gate:
+                    self.direction = -1
+                    self.low, self.low_at = value, n
+                elif value - self.low > self.gate:
+                    self.direction = 1
+                    self.high, self.high_at = value, n
+            elif self.direction > 0 and self.high - value > self.gate:
+                self.turn(self.high_at - lag, hill=True)
+                self.direction = -1
+                self.low, self.low_at = value, n
+            elif self.direction < 0 and value - self.low > self.gate:
+                self.turn(self.low_at - lag, hill=False)
+                self.direction = 1
+                self.high, self.high_at = value, n
+
+        # samples before the running cycle are only kept for the next trailing windows
+        keep = max(min(self.cycle_start, self.n_samples - self.smoothing), self.origin)
+        self.travel = self.travel[keep - self.origin:]
+        self.stress = self.stress[keep - self.origin:]
+        self.origin = keep
+
+        return self.events[n_events:]
+
+    def turn(self, position, hill):
+        position = max(position, self.cycle_start)
+        if hill:
+            self.hill = position
+            return
+
+        # a valley closes the running cycle, a test starting downwards begins with an incomplete one
+        if self.hill is not None:
+            self.n_cycles += 1
+            self.evaluate(self.cycle_start, self.hill, position)
+        elif self.n_cycles == 0:
+            self.n_cycles += 1
+        self.cycle_start, self.hill = position, None
+
+    def evaluate(self, start, hill, stop):
+        travel = self.travel[start - self.origin:stop - self.origin]
+        stress = self.stress[start - self.origin:stop - self.origin]
+        split = hill - start
+
+        # the same border filters and closed-form fits as fit.linear, 'Dynamic' uses its choice for later cycles
+        row = {'Cycle': self.n_cycles, 'start': start, 'hill': hill, 'stop': stop}
+        for down, (x, y) in enumerate([(travel[:split], stress[:split]), (travel[split:], stress[split:])]):
+            chunk_filter = fit.resolve_filter(self.range_filter, self.n_cycles - 1, down, 0)
+            first, last = fit.calc_borders(chunk_filter, down, x, y)
+            if last <= first:
+                first, last = 0, len(x)
+            slope, intercept, r2 = fit.segment_fits(x[first:last], y[first:last], np.array([0, last - first]))
+            suffix = '' if down == 0 else '_unloading'
+            row.update({f'E{suffix}': slope[0] / 10, f'r2{suffix}': r2[0], f't{suffix}': intercept[0]})
+
+        # hysteresis area of the single cycle with the batched implementation
+        cycles = preprocessing.CycleTable({'Standard travel': travel, 'Standard stress': stress},
+                                          np.array([0, split]), np.array([split, len(travel)]), np.array([[0, 1]]))
+        results = hysteresis.calc(cycles, smoothing=self.smoothing_hyst)
+        row['area'] = results['areas']['1'][0] if '1' in results['areas'] else np.nan
+        row['E_secant'] = results['E_loading'].get('1', np.nan)
+
+        self.rows.append(row)
+        self.detect(row)
+
+    def detect(self, row):
+        modulus = row['E']
+        if modulus != modulus:
+            return
+
+        # a drop below the reference of the first baseline is reported once
+        if self.reference is not None and self.reference != 0 and not self.dropped:
+            drop_pct = (1 - modulus / self.reference) * 100
+            if drop_pct >= self.drop_pct:
+                self.dropped = True
+                self.emit(row, 'drop', drop_pct)
+
+        # the cycles after the start or after a change define the level of the modulus and its spread
+        if self.n_baseline < self.baseline:
+            self.n_baseline += 1
+            delta = modulus - self.mean
+            self.mean += delta / self.n_baseline
+            self.m2 += delta * (modulus - self.mean)
+            if self.n_baseline == self.baseline and self.reference is None:
+                self.reference = self.mean
+            return
+
+        # one-sided CUSUM for a decreasing modulus in units of the baseline standard deviation, a change starts a new
+        # baseline at the new level
+        sigma = math.sqrt(self.m2 / (self.n_baseline - 1)) if self.n_baseline > 1 else 0.0
+        sigma = max(sigma, 1e-9 * abs(self.mean), 1e-12)
+        self.cusum = max(0.0, self.cusum + (self.mean - modulus) / sigma - self.drift)
+        if self.cusum > self.threshold:
+            self.emit(row, 'change', self.cusum)
+            self.n_baseline, self.mean, self.m2 = 0, 0.0, 0.0
+            self.cusum = 0.0
+
+    def emit(self, row, kind, statistic):
+        event = {'cycle': row['Cycle'], 'event': kind, 'E': row['E'], 'statistic': statistic,
+                 'sample': row['stop']}
+        logger.info(f'Cycle {event["cycle"]}: {kind} of the loading modulus, E: {event["E"]}, '
+                    f'statistic: {statistic}')
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def to_frame(self):
+        return pd.DataFrame(self.rows, columns=['Cycle', 'start', 'hill', 'stop', 'E', 'r2', 't', 'E_unloading',
+                                                'r2_unloading', 't_unloading', 'area', 'E_secant'])
+
+
+def follow(path_to_file, values, interval=1.0, timeout=None):
+    logger.info(f'Called follow for {path_to_file}')
+
+    reader = io_data.TailReader(path_to_file, is_percent=analysis_settings.as_bool(values['is_percent']))
+    monitor = CycleMonitor(analysis_settings.range_filter(values), **analysis_settings.monitor_kwargs(values),
+                           on_event=lambda event: print(f'cycle {event["cycle"]}: {event["event"]} '
+                                                        f'(E = {event["E"]:.3f} GPa, '
+                                                        f'statistic = {event["statistic"]:.2f})', flush=True))
+
+    # polls until no new samples arrived for timeout seconds, without a timeout until interrupted
+    idle_since = time.time()
+    try:
+        while True:
+            batch = reader.poll()
+            if not batch.empty:
+                idle_since = time.time()
+                monitor.push(batch)
+            elif timeout is not None and time.time() - idle_since > timeout:
+                break
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info('Stopped following')
+
+    logger.info(f'Followed {monitor.n_cycles} cycles, {len(monitor.events)} events')
+    return monitor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Follow a running cyclic test and report stiffness changes.')
+    parser.add_argument('input', help='export file that is still being written')
+    parser.add_argument('-s', '--settings', default=None,
+                        help='ctanalyzer.ini or a json file with the keys of the GUI settings')
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help='seconds between two polls')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='stop after this many seconds without new samples')
+    parser.add_argument('-o', '--output', default=None, help='write the per-cycle results to this file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every cycle')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO if args.verbose else logging.WARNING)
+
+    values = analysis_settings.read(args.settings)
+    monitor = follow(args.input, values, interval=args.interval, timeout=args.timeout)
+
+    if args.output is not None:
+        monitor.to_frame().to_csv(args.output, sep='\t', index=False)
+    return 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import json
+import logging
+import numpy as np
+import os
+import re
+
+from src import filters, io_data, preprocessing
+
+logger = logging.getLogger(__name__)
+
+# samples held in memory at once by the windowed stages, overridable per call
+WINDOW = 2 ** 22
+MEDIAN_BINS = 4096
+
+
+def convert(path_to_file, folder_out, is_percent=True, log=False):
+    logger.info(f'Called convert for {path_to_file}')
+
+    if not os.path.isdir(folder_out):
+        os.makedirs(folder_out)
+
+    # one-time conversion: every column is appended block-wise to its own raw float64 file
+    with io_data.open_input(path_to_file) as input_file:
+        meta, names = io_data.read_header(input_file)
+        outputs = [open(os.path.join(folder_out, column_file(name)), 'wb') for name in names]
+        n_rows = 0
+        try:
+            for values in io_data.iter_body(input_file, len(names)):
+                if not is_percent:
+                    values[:, names.index('Standard travel')] *= 100
+                for n, output in enumerate(outputs):
+                    np.ascontiguousarray(values[:, n]).tofile(output)
+                n_rows += len(values)
+        finally:
+            for output in outputs:
+                output.close()
+
+    with open(os.path.join(folder_out, 'meta.json'), 'w') as file:
+        json.dump({'names': names, 'n_rows': n_rows, 'meta': meta}, file, indent=4)
+
+    if log and not is_percent:
+        logger.info('Converted the strain to percent by multiplying with 100')
+
+    logger.info(f'Converted {n_rows} rows to {folder_out}')
+    return open_mapped(folder_out)
+
+
+def open_mapped(folder):
+    with open(os.path.join(folder, 'meta.json'), 'r') as file:
+        stored = json.load(file)
+
+    # the converted columns are only read, calculate_stress writes its own file next to them
+    columns = {}
+    for name in stored['names'] + ['Standard stress']:
+        path_column = os.path.join(folder, column_file(name))
+        if os.path.isfile(path_column) and stored['n_rows'] > 0:
+            columns[name] = np.memmap(path_column, dtype=np.float64, mode='r', shape=(stored['n_rows'],))
+        elif os.path.isfile(path_column):
+            columns[name] = np.empty(0, dtype=np.float64)
+
+    return columns, stored['meta']
+
+
+def column_file(name):
+    return re.sub('[^0-9a-z]+', '_', name.lower()) + '.f8'
+
+
+def prepare(columns, x_dimensions=1.3, y_dimensions=10.0, factor=50, smoothing=15, distance=5, width=5,
+            split_peaks=False, filter_value=0.005, smoothing_method='Moving average', window=WINDOW, log=False):
+    logger.info(f'Called prepare with window: {window}')
+
+    calculate_stress(columns, x_dimensions, y_dimensions, window)
+
+    n_end = cut_end(columns, factor, window)
+
+    peaks, hills, valleys = detect_peaks(columns, n_end, smoothing, distance,
+                                         width, split_peaks, filter_value, smoothing_method, window)
+
+    # only the normal cycles are grouped, the pre-loading peaks are kept for the turning points like in
+    # preprocessing.collect_cycles
+    preloading = {}
+    if split_peaks:
+        preloading = {'hills': hills['preloading'], 'valleys': valleys['preloading']}
+        peaks, hills, valleys = peaks['normal'], hills['normal'], valleys['normal']
+
+    cycles = groupify(columns, n_end, peaks, hills, valleys)
+
+    # drop the connectors between pre-loading and normal cycles, see preprocessing.prepare
+    if split_peaks:
+        cycles = cycles.drop_connectors()
+
+    if log:
+        logger.info(f'{len(cycles)} cycles grouped from {n_end} samples')
+
+    d = {'n_end': n_end, 'peaks': peaks, 'hills': hills, 'valleys': valleys, 'preloading': preloading,
+         'cycles': cycles}
+
+    logger.info(f'Out-of-core preprocessing exited without errors')
+    return d
+
+
+def calculate_stress(columns, x_dimensions, y_dimensions, window=WINDOW):
+    logger.info(f'Called calculate_stress with x: {x_dimensions} mm, y: {y_dimensions} mm')
+
+    geometry = x_dimensions * y_dimensions
+    force = columns['Standard force']
+
+    # the stress is mapped next to the force column, an existing stress file of the same length is overwritten in
+    # place so that maps of it held elsewhere stay valid. Columns that are not mapped get an in-memory stress
+    if isinstance(force, np.memmap) and force.filename is not None:
+        path_stress = os.path.join(os.path.dirname(force.filename), column_file('Standard stress'))
+        exists = os.path.isfile(path_stress) and os.path.getsize(path_stress) == force.nbytes
+        stress = np.memmap(path_stress, dtype=np.float64, mode='r+' if exists else 'w+', shape=force.shape)
+    else:
+        stress = np.empty(len(force), dtype=np.float64)
+
+    for start in range(0, len(force), window):
+        np.divide(force[start:start + window], geometry, out=stress[start:start + window])
+    if isinstance(stress, np.memmap):
+        stress.flush()
+    columns['Standard stress'] = stress
+
+    logger.info(f'Stress calculated with A: {geometry} mm²')
+    return columns
+
+
+def cut_end(columns, factor, window=WINDOW):
+    logger.info(f'Called cut_end with factor: {factor}')
+
+    travel = columns['Standard travel']
+    trigger = windowed_median(travel, window) * factor
+
+    # first sample whose distance to its successor exceeds the trigger marks the end of the experiment
+    n_end = len(travel)
+    for start, diffs in iter_abs_diff(travel, window):
+        above = np.flatnonzero(diffs > trigger)
+        if len(above) > 0:
+            n_end = start + above[0]
+            break
+
+    logger.info(f'Calculated end of experiment, median derivative factor: {factor}')
+    return n_end
+
+
+def iter_abs_diff(values, window):
+    # absolute forward differences, the windows overlap by one sample
+    for start in range(0, len(values) - 1, window):
+        block = np.asarray(values[start:start + window + 1])
+        yield start, np.abs(np.diff(block))
+
+
+def windowed_median(values, window=WINDOW):
+    # exact median of the absolute differences by histogram narrowing, only one window is held at once
+    count, low, high = 0, np.inf, -np.inf
+    for start, diffs in iter_abs_diff(values, window):
+        diffs = diffs[~np.isnan(diffs)]
+        if len(diffs) > 0:
+            count += len(diffs)
+            low = min(low, diffs.min())
+            high = max(high, diffs.max())
+
+    if count == 0:
+        return np.nan
+
+    upper = select_rank(values, count // 2, low, high, window)
+    if count % 2 != 0:
+        return upper
+    return (select_rank(values, count // 2 - 1, low, high, window) + upper) / 2
+
+
+def select_rank(values, rank, low, high, window):
+    # candidates are low <= v < high, or low <= v <= high while the upper border is the global maximum
+    below, closed = 0, True
+
+    while True:
+        if low == high or np.nextafter(low, high) >= high:
+            return low
+
+        edges = np.linspace(low, high, MEDIAN_BINS + 1)
+        counts = np.zeros(MEDIAN_BINS, dtype=np.int64)
+        for start, diffs in iter_abs_diff(values, window):
+            candidates = diffs[(diffs >= low) & ((diffs <= high) if closed else (diffs < high))]
+            bins = np.clip(np.searchsorted(edges, candidates, side='right') - 1, 0, MEDIAN_BINS - 1)
+            counts += np.bincount(bins, minlength=MEDIAN_BINS)
+
+        cumulative = below + np.cumsum(counts)
+        target = int(np.searchsorted(cumulative, rank, side='right'))
+        below = cumulative[target] - counts[target]
+        closed = closed and target == MEDIAN_BINS - 1
+        low, high = edges[target], edges[target + 1]
+
+        # the bin fits into one window: collect it and select directly
+        if counts[target] <= window:
+            selected = []
+            for start, diffs in iter_abs_diff(values, window):
+                selected.append(diffs[(diffs >= low) & ((diffs <= high) if closed else (diffs < high))])
+            selected = np.concatenate(selected)
+            return np.partition(selected, rank - below)[rank - below]
+
+
+def detect_peaks(columns, n_end, smoothing, distance, width, split_peaks, filter_value,
+                 smoothing_method='Moving average', window=WINDOW):
+    logger.info(f'Called detect_peaks with smoothing: {smoothing} ({smoothing_method}), distance: {distance}, '
+                f'width: {width}')
+    import scipy.signal as signal
+
+    travel = columns['Standard travel']
+
+    # every window is extended by a margin so that smoothing, distance and width see the neighbouring cycles
+    margin = max(window // 8, 8 * (smoothing + distance + width))
+    hills, valleys = [], []
+    for start in range(0, n_end, window):
+        stop = min(start + window, n_end)
+        ext_start, ext_stop = max(start - margin, 0), min(stop + margin, n_end)
+
+        smooth = filters.smooth(np.asarray(travel[ext_start:ext_stop]), smoothing, smoothing_method)
+        found_hills, null_up = signal.find_peaks(smooth, distance=distance, width=width)
+        found_valleys, null_down = signal.find_peaks(np.negative(smooth), distance=distance, width=width)
+
+        # keep the peaks of the window core only, the margins belong to the neighbouring windows
+        found_hills = found_hills + ext_start
+        found_valleys = found_valleys + ext_start
+        hills.append(found_hills[(found_hills >= start) & (found_hills < stop)])
+        valleys.append(found_valleys[(found_valleys >= start) & (found_valleys < stop)])
+
+    hills = np.concatenate(hills) if hills else np.empty(0, dtype=np.int64)
+    valleys = np.concatenate(valleys) if valleys else np.empty(0, dtype=np.int64)
+    peaks = np.sort(np.concatenate([valleys, hills]))
+    logger.info(f'{len(peaks)} peaks detected')
+
+    if split_peaks:
+        hills_normal = preprocessing.classify_peaks(np.asarray(travel[hills]), filter_value)
+        valleys_normal = preprocessing.classify_peaks(np.asarray(travel[valleys]), filter_value)
+
+        hills = {'preloading': hills[~hills_normal], 'normal': hills[hills_normal]}
+        valleys = {'preloading': valleys[~valleys_normal], 'normal': valleys[valleys_normal]}
+        peaks = {category: np.sort(np.concatenate([valleys[category], hills[category]]))
+                 for category in ['preloading', 'normal']}
+
+    return peaks, hills, valleys
+
+
+def groupify(columns, n_end, peaks, hills, valleys):
+    logger.info(f'Called groupify')
+
+    # same cycle table as preprocessing.groupify, the chunks are sliced from the memory-mapped columns on request
+    first_is_hill = None
+    if len(hills) != 0 and len(valleys) != 0:
+        first_is_hill = bool(hills[0] < valleys[0])
+
+    names = ['Test time', 'Standard force', 'Standard travel', 'Strain', 'Standard stress']
+    mapped = {name: columns[name] for name in names}
+    cycles = preprocessing.CycleTable.from_peaks(mapped, np.asarray(peaks), n_end, first_is_hill)
+
+    logger.info(f'Sections grouped')
+    return cycles
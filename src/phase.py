@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# phase points per half-cycle, the matrices are stored in single precision
+PHASE_POINTS = 100
+COLUMNS = ['Standard travel', 'Standard stress']
+
+
+def normalize(cycles, n_points=PHASE_POINTS, dtype=np.float32):
+    logger.info(f'Called normalize with {n_points} phase points')
+
+    # every half of every complete cycle is resampled at n_points equidistant fractions of its duration, by linear
+    # interpolation between the neighbouring samples of the shared column buffers. The (cycles x phase) index arrays
+    # are built by broadcasting, there is no loop over the cycles
+    numbers = cycles.complete()
+    phase = np.linspace(0, 1, n_points)
+    matrix = {'cycles': numbers + 1, 'phase': phase}
+
+    for down, half in enumerate(['loading', 'unloading']):
+        chunks = cycles.halves[numbers, down]
+        start = cycles.start[chunks][:, np.newaxis]
+        last = cycles.stop[chunks][:, np.newaxis] - 1
+
+        position = start + phase[np.newaxis, :] * (last - start)
+        lower = np.minimum(np.floor(position).astype(np.int64), last)
+        upper = np.minimum(lower + 1, last)
+        weight = position - lower
+
+        matrix[half] = {}
+        for name in COLUMNS:
+            column = cycles.columns[name]
+            values = column[lower] + weight * (column[upper] - column[lower])
+            matrix[half][name] = values.astype(dtype)
+
+    logger.info(f'Normalized {len(numbers)} cycles')
+    return matrix
+
+
+def mean_loop(matrix):
+    # ensemble average over all cycles at every phase point, accumulated in double precision
+    loop = {'phase': matrix['phase']}
+    for half in ['loading', 'unloading']:
+        for name in COLUMNS:
+            loop[f'{half} {name}'] = np.nanmean(matrix[half][name], axis=0, dtype=np.float64)
+    return pd.DataFrame(loop)
+
+
+def deviation(matrix):
+    # root mean square distance of every cycle's stress from the mean loop, per half
+    result = {'Cycle': matrix['cycles']}
+    for half in ['loading', 'unloading']:
+        stress = matrix[half]['Standard stress'].astype(np.float64)
+        result[half] = np.sqrt(np.nanmean((stress - np.nanmean(stress, axis=0)) ** 2, axis=1))
+    return pd.DataFrame(result)
+
+
+def master_curves(matrix):
+    # extremes of every cycle over both halves, one reduction per column
+    curves = {'Cycle': matrix['cycles']}
+    for name, column in [('strain', 'Standard travel'), ('stress', 'Standard stress')]:
+        loop = np.concatenate([matrix['loading'][column], matrix['unloading'][column]], axis=1)
+        curves[f'min_{name}'] = np.nanmin(loop, axis=1) if loop.size else np.empty(0)
+        curves[f'max_{name}'] = np.nanmax(loop, axis=1) if loop.size else np.empty(0)
+    return pd.DataFrame(curves)
+
+
+def calc(cycles, n_points=PHASE_POINTS, log=False):
+    logger.info('Called calc')
+
+    matrix = normalize(cycles, n_points)
+    results = {'matrix': matrix, 'mean_loop': mean_loop(matrix), 'deviation': deviation(matrix),
+               'master_curves': master_curves(matrix)}
+
+    if log and len(matrix['cycles']) > 0:
+        worst = results['deviation'].sort_values('loading').iloc[-1]
+        logger.info(f'Largest loading deviation from the mean loop: {worst["loading"]} in cycle {int(worst["Cycle"])}')
+
+    logger.info(f'Successfully calculated the phase matrix of {len(matrix["cycles"])} cycles')
+    return results
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+
+from src import analysis_settings, fit, hysteresis, io_data, phase, preprocessing, rainflow
+
+logger = logging.getLogger(__name__)
+
+
+# the evaluation as a dependency graph. Every stage lists the stages it consumes and the settings keys it reads, its
+# output is memoized under a hash of both, so a settings change only recomputes the stages reading the changed key
+# and the ones downstream of them. 'groupify' returns the same (df, d) as preprocessing.prepare. Saving is a side
+# effect and is never skipped, it is not part of the graph
+def run_load(path_to_file, values):
+    is_percent = analysis_settings.as_bool(values['is_percent'])
+    if analysis_settings.as_bool(values['use_cache']):
+        return io_data.load_cached(path_to_file, values['cache_path'], is_percent=is_percent,
+                                   max_mb=int(values['cache_size']))
+    return io_data.load_data(path_to_file, is_percent=is_percent)
+
+
+def run_stress(loaded, values):
+    # a shallow copy keeps the loaded frame unchanged, only the new column is allocated
+    df, meta = loaded
+    return preprocessing.calculate_stress(df.copy(deep=False), float(values['x_dimensions']),
+                                          float(values['y_dimensions']))
+
+
+def run_cut_end(df_stress, values):
+    return preprocessing.cut_end(df_stress, int(values['factor']))
+
+
+def run_detect_peaks(df, values):
+    kwargs = analysis_settings.prepare_kwargs(values)
+    return preprocessing.detect_peaks(df, kwargs['smoothing'], kwargs['distance'], kwargs['width'],
+                                      kwargs['split_peaks'], kwargs['filter_value'], kwargs['smoothing_method'])
+
+
+def run_groupify(df_stress, df, peaks, values):
+    df_min_max, hills, valleys, smooth_travel = peaks
+    d = preprocessing.collect_cycles(df_stress, df, df_min_max, hills, valleys, smooth_travel,
+                                     analysis_settings.as_bool(values['split_peaks']))
+    return df, d
+
+
+def run_master(prepared, values):
+    df, d = prepared
+    return preprocessing.get_master_curves(df, d['hills'], d['valleys'])
+
+
+def run_fit(prepared, values):
+    df, d = prepared
+    # the GUI never starts worker processes, see analysis_settings.fit_kwargs
+    return fit.linear(df, d['cycles'], analysis_settings.range_filter(values),
+                      **analysis_settings.fit_kwargs(values, processes=False))
+
+
+def run_hysteresis(prepared, values):
+    df, d = prepared
+    return hysteresis.calc(d['cycles'], smoothing=int(values['smoothing_hyst']))
+
+
+def run_rainflow(prepared, values):
+    df, d = prepared
+    return rainflow.calc(df, d, strain_bin_width=float(values['rainflow_strain_bin']),
+                         stress_bin_width=float(values['rainflow_stress_bin']))
+
+
+def run_phase(prepared, values):
+    df, d = prepared
+    return phase.calc(d['cycles'], n_points=int(values['phase_points']))
+
+
+# name: (dependencies, settings keys, function), a stage without dependencies reads the input file
+STAGES = {'load': ([], ['is_percent', 'use_cache', 'cache_path', 'cache_size'], run_load),
+          'stress': (['load'], ['x_dimensions', 'y_dimensions'], run_stress),
+          'cut_end': (['stress'], ['factor'], run_cut_end),
+          'detect_peaks': (['cut_end'], ['smoothing_pre', 'smoothing_method', 'peak_distance', 'peak_width',
+                                         'split_peaks', 'filter_value'], run_detect_peaks),
+          'groupify': (['stress', 'cut_end', 'detect_peaks'], ['split_peaks'], run_groupify),
+          'master': (['groupify'], [], run_master),
+          'fit': (['groupify'], ['range_filter', 'lower_strain', 'upper_strain', 'rel_cutoff_pct', 'no_sections',
+                                 'section_stride_pct', 'window_min_samples', 'window_min_strain', 'window_criterion',
+                                 'smoothing_dynamic', 'dynamic_line_divisor', 'fit_executor', 'fit_workers'], run_fit),
+          'hysteresis': (['groupify'], ['smoothing_hyst'], run_hysteresis),
+          'rainflow': (['groupify'], ['rainflow_strain_bin', 'rainflow_stress_bin'], run_rainflow),
+          'phase': (['groupify'], ['phase_points'], run_phase)}
+
+
+class Pipeline:
+    # memoized evaluation of one input file. Only the latest output of every stage is kept, outputs are shared with
+    # the caller and must not be modified
+    def __init__(self, path_to_file, stages=None):
+        self.path_to_file = path_to_file
+        self.stages = STAGES if stages is None else stages
+        self.cache = {}
+
+    def key(self, name, values):
+        # the keys of the dependencies stand in for their outputs, the file is identified like in io_data.cache_key
+        dependencies, keys, function = self.stages[name]
+        parts = [name] + [f'{key}={values[key]}' for key in keys]
+        if dependencies:
+            parts += [self.key(dependency, values) for dependency in dependencies]
+        else:
+            stat = os.stat(self.path_to_file)
+            parts += [os.path.abspath(self.path_to_file), str(stat.st_size), str(stat.st_mtime_ns)]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def is_current(self, name, values):
+        return name in self.cache and self.cache[name][0] == self.key(name, values)
+
+    def run(self, name, values):
+        key = self.key(name, values)
+        if name in self.cache and self.cache[name][0] == key:
+            logger.info(f'Reused {name}')
+            return self.cache[name][1]
+
+        dependencies, keys, function = self.stages[name]
+        inputs = [self.run(dependency, values) for dependency in dependencies] or [self.path_to_file]
+        logger.info(f'Computing {name}')
+        output = function(*inputs, values)
+        self.cache[name] = (key, output)
+        return output
+
+    def invalidate(self, name=None):
+        # frees the memoized outputs of one stage or of all of them, the stages are deterministic so the outputs
+        # downstream stay valid
+        if name is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(name, None)
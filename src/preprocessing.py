@@ -1,98 +1,86 @@
 import logging
 import numpy as np
-import scipy.signal as signal
-import matplotlib
-import matplotlib.pyplot as plt
 import pandas as pd
 
-matplotlib.use('Qt5Agg')
+from src import downsample, filters
+
+# heavy imports (scipy, matplotlib) are deferred to the functions using them
 logger = logging.getLogger(__name__)
 
 
 def prepare(df, x_dimensions=1.3, y_dimensions=10.0, factor=50, smoothing=15,
-            distance=5, width=5, split_peaks=False, filter_value=0.005, figsize=(20, 10), log=False):
+            distance=5, width=5, split_peaks=False, filter_value=0.005, smoothing_method='Moving average', log=False):
     logger.info(f'Called prepare')
 
-    # init
-    fig = plt.figure(figsize=figsize)
-    ax = fig.add_subplot()
-    ax.set_xlabel('Time [s]')
-    ax.set_ylabel('Strain [%]')
-    ax.set_title('Preprocessing results')
-
     # call auxiliary functions
     df_stress = calculate_stress(df, x_dimensions, y_dimensions)
 
     df = cut_end(df_stress, factor)
 
-    df_min_max, hills, valleys = detect_peaks(df, smoothing, distance,
-                                              width, split_peaks, filter_value)
+    df_min_max, hills, valleys, smooth_travel = detect_peaks(df, smoothing, distance, width, split_peaks,
+                                                             filter_value, smoothing_method)
 
-    # first index: 0=df_min_max, 1=hills, 2=valleys // second index: 0=preloading or normal?, 1=the actual data
-    if split_peaks:
-        dfs_chunks = {}
-        dfs_grouped = {}
-        for zipped in zip(df_min_max.items(), hills.items(), valleys.items()):
-            dfs_chunks[zipped[0][0]], dfs_grouped[zipped[0][0]] = groupify(df, zipped[0][1], zipped[1][1], zipped[2][1])
-    else:
-        dfs_chunks, dfs_grouped = groupify(df, df_min_max, hills, valleys)
+    d = collect_cycles(df_stress, df, df_min_max, hills, valleys, smooth_travel, split_peaks)
 
     if log:
-        logger.info('Finished calling auxiliary functions, starting plot')
+        logger.info(f'Finished calling auxiliary functions, {len(d["cycles"])} cycles found')
 
-    # plotting
-    ax.plot(df['Test time'],
-            df['Standard travel'], color='dimgrey')
+    logger.info(f'Preprocessing exited without errors')
+    return df, d
 
-    if split_peaks:
-        ax.scatter(df_min_max['normal'][df_min_max['normal'].index.isin(hills['normal'].values)]['Test time'],
-                   df_min_max['normal'][df_min_max['normal'].index.isin(hills['normal'].values)]['Standard travel'],
-                   color='orangered')
-        ax.scatter(df_min_max['normal'][df_min_max['normal'].index.isin(valleys['normal'].values)]['Test time'],
-                   df_min_max['normal'][df_min_max['normal'].index.isin(valleys['normal'].values)]['Standard travel'],
-                   color='darkviolet')
-        ax.scatter(df_min_max['preloading'][df_min_max['preloading'].index.isin(hills['preloading'].values)]['Test time'],
-                   df_min_max['preloading'][df_min_max['preloading'].index.isin(hills['preloading'].values)]['Standard travel'],
-                   color='gold')
-        ax.scatter(df_min_max['preloading'][df_min_max['preloading'].index.isin(valleys['preloading'].values)]['Test time'],
-                   df_min_max['preloading'][df_min_max['preloading'].index.isin(valleys['preloading'].values)]['Standard travel'],
-                   color='turquoise')
-        i = 1
-        for item in hills['normal'].iteritems():
-            ax.annotate(i, xy=(df_min_max['normal'].at[item[1], 'Test time'],
-                               df_min_max['normal'].at[item[1], 'Standard travel']))
-            i += 1
 
-    else:
-        ax.scatter(df_min_max[df_min_max.index.isin(hills.values)]['Test time'],
-                   df_min_max[df_min_max.index.isin(hills.values)]['Standard travel'],
-                   color='orangered')
-        ax.scatter(df_min_max[df_min_max.index.isin(valleys.values)]['Test time'],
-                   df_min_max[df_min_max.index.isin(valleys.values)]['Standard travel'],
-                   color='darkviolet')
-        i = 1
-        for item in hills.iteritems():
-            ax.annotate(i, xy=(df_min_max.at[item[1], 'Test time'],
-                               df_min_max.at[item[1], 'Standard travel']))
-            i += 1
-
-    # return the relevant, normal cycles if pre-loading was involved, rm the connectors TODO rm the group popping
+def collect_cycles(df_stress, df, df_min_max, hills, valleys, smooth_travel, split_peaks):
+    # only the normal cycles are relevant if pre-loading was involved
+    preloading = {}
     if split_peaks:
-        dfs_grouped = dfs_grouped['normal']
-        dfs_chunks = dfs_chunks['normal']
+        preloading = {'hills': hills['preloading'], 'valleys': valleys['preloading']}
+        cycles = groupify(df, df_min_max['normal'], hills['normal'], valleys['normal'])
         hills = hills['normal']
         valleys = valleys['normal']
 
-        for group in dfs_grouped:
-            if len(group) > 1 and abs(len(group[0])-len(group[1])) > 10:
-                group.pop(-1)
+        # rm the connectors between pre-loading and normal cycles
+        cycles = cycles.drop_connectors()
+    else:
+        cycles = groupify(df, df_min_max, hills, valleys)
+
+    return {'df_stress': df_stress, 'df_min_max': df_min_max,
+            'hills': hills, 'valleys': valleys, 'preloading': preloading,
+            'cycles': cycles, 'smooth_travel': smooth_travel}
+
+
+def plot_prepare(df, d, figsize=(20, 10), max_points=None, decimation='LTTB'):
+    logger.info(f'Called plot_prepare')
+    import matplotlib.pyplot as plt
+
+    # init
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_subplot()
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Strain [%]')
+    ax.set_title('Preprocessing results')
+
+    hills, valleys = d['hills'], d['valleys']
+
+    # the peaks are positions in df, their coordinates are looked up directly
+    time, travel = df['Test time'].values, df['Standard travel'].values
+
+    # plotting, curves and peaks are reduced to max_points each
+    downsample.plot(ax, time, travel, max_points, decimation, color='dimgrey')
 
-    d = {'df_stress': df_stress, 'df_min_max': df_min_max,
-         'hills': hills, 'valleys': valleys,
-         'dfs_chunks': dfs_chunks, 'dfs_grouped': dfs_grouped}
+    scatters = [(hills, 'orangered'), (valleys, 'darkviolet')]
+    if d['preloading']:
+        scatters += [(d['preloading']['hills'], 'gold'), (d['preloading']['valleys'], 'turquoise')]
+    for peaks, color in scatters:
+        downsample.scatter(ax, time[peaks.values], travel[peaks.values], max_points, decimation, color=color)
 
-    logger.info(f'Preprocessing exited without errors, plotting graph')
-    return df, d, fig
+    # only the hills that are drawn get their cycle number
+    numbers = np.arange(1, len(hills) + 1)
+    positions = hills.values
+    keep = downsample.select(time[positions], travel[positions], max_points, decimation)
+    for i, position in zip(numbers[keep], positions[keep]):
+        ax.annotate(i, xy=(time[position], travel[position]))
+
+    return fig
 
 
 def calculate_stress(df, x_dimensions, y_dimensions):
@@ -121,16 +109,19 @@ def cut_end(df, factor):
     return df
 
 
-def detect_peaks(df, smoothing, distance, width, split_peaks, filter_value):
-    logger.info(f'Called detect_peaks with smoothing: {smoothing}, distance: {distance}, width: {width}')
+def detect_peaks(df, smoothing, distance, width, split_peaks, filter_value, smoothing_method='Moving average'):
+    logger.info(f'Called detect_peaks with smoothing: {smoothing} ({smoothing_method}), distance: {distance}, '
+                f'width: {width}')
+    import scipy.signal as signal
 
-    df_smooth = df.rolling(window=smoothing, center=True).mean()
+    # only the strain is smoothed, the smoothed signal is returned for reuse
+    smooth_travel = filters.smooth(df['Standard travel'].values, smoothing, smoothing_method)
 
-    hills, null_up = signal.find_peaks(df_smooth['Standard travel'].values,
+    hills, null_up = signal.find_peaks(smooth_travel,
                                        distance=distance,
                                        width=width)
 
-    valleys, null_down = signal.find_peaks(np.negative(df_smooth['Standard travel'].values),
+    valleys, null_down = signal.find_peaks(np.negative(smooth_travel),
                                            distance=distance,
                                            width=width)
 
@@ -140,34 +131,20 @@ def detect_peaks(df, smoothing, distance, width, split_peaks, filter_value):
     valleys = pd.Series(valleys)
 
     if split_peaks:
-        # cast hills/valleys as DataFrame
-        df_hills = df[df.index.isin(hills.values)]
-        df_valleys = df[df.index.isin(valleys.values)]
-
-        # calculate diff to previous/next hill or valley
-        # the specified fillna values are based on the assumption that the beginning and end of the experiment belong
-        # to the preloading category. The value 1000 is arbitrary and has no meaning
-        hills_prev = abs(df_hills.diff(periods=1)).fillna(1000)
-        hills_next = abs(df_hills.diff(periods=-1)).fillna(1000)
-        valleys_prev = abs(df_valleys.diff(periods=1)).fillna(1000)
-        valleys_next = abs(df_valleys.diff(periods=-1)).fillna(1000)
-
-        # filter by difference threshold into preloading and normal category
-        df_hills_preloading = df_hills[(hills_next['Standard travel'] > filter_value) &
-                                       (hills_prev['Standard travel'] > filter_value)]
-        df_hills_normal = df_hills[(hills_next['Standard travel'] <= filter_value) |
-                                   (hills_prev['Standard travel'] <= filter_value)]
-
-        df_valleys_preloading = df_valleys[(valleys_next['Standard travel'] > filter_value) &
-                                           (valleys_prev['Standard travel'] > filter_value)]
-        df_valleys_normal = df_valleys[(valleys_next['Standard travel'] <= filter_value) |
-                                       (valleys_prev['Standard travel'] <= filter_value)]
-
-        hills = {'preloading': df_hills_preloading.index.to_series(), 'normal': df_hills_normal.index.to_series()}
-        valleys = {'preloading': df_valleys_preloading.index.to_series(), 'normal': df_valleys_normal.index.to_series()}
-
-        peaks_preloading = np.sort(np.concatenate([valleys['preloading'].values, hills['preloading'].values]))
-        peaks_normal = np.sort(np.concatenate([valleys['normal'].values, hills['normal'].values]))
+        # classify on the strain at the peaks only, the cost scales with the number of peaks
+        travel = df['Standard travel'].values
+        hills_normal = classify_peaks(travel[hills.values], filter_value)
+        valleys_normal = classify_peaks(travel[valleys.values], filter_value)
+
+        hills = {'preloading': hills.values[~hills_normal], 'normal': hills.values[hills_normal]}
+        valleys = {'preloading': valleys.values[~valleys_normal], 'normal': valleys.values[valleys_normal]}
+
+        peaks_preloading = np.sort(np.concatenate([valleys['preloading'], hills['preloading']]))
+        peaks_normal = np.sort(np.concatenate([valleys['normal'], hills['normal']]))
+
+        # the categories are Series labelled by their own values like the ones of index.to_series()
+        hills = {category: pd.Series(values, index=values) for category, values in hills.items()}
+        valleys = {category: pd.Series(values, index=values) for category, values in valleys.items()}
 
         df = {'preloading': df.iloc[peaks_preloading, :], 'normal': df.iloc[peaks_normal, :]}
 
@@ -175,72 +152,168 @@ def detect_peaks(df, smoothing, distance, width, split_peaks, filter_value):
         df = df.iloc[peaks, :]
 
     logger.info(f'{len(peaks)} peaks detected')
-    return df, hills, valleys
+    return df, hills, valleys, smooth_travel
+
+
+def classify_peaks(travel_at_peaks, filter_value):
+    # a peak is normal if its strain is close to the previous or next peak of the same kind. The beginning and end of
+    # the experiment are assumed to belong to the preloading category, so are peaks with a NaN strain
+    prev = np.full(len(travel_at_peaks), np.inf)
+    following = np.full(len(travel_at_peaks), np.inf)
+    prev[1:] = np.abs(np.diff(travel_at_peaks))
+    following[:-1] = prev[1:]
+    return (prev <= filter_value) | (following <= filter_value)
 
 
 def groupify(df_end, df_min_max, hills, valleys):
     logger.info(f'Called groupify')
 
-    dfs_chunks = []
-    prev = 0
-    for row in df_min_max.iterrows():
-        dfs_chunks.append(df_end.iloc[prev:row[0]])
-        prev = row[0]
-    dfs_chunks.append(df_end.iloc[prev:])
-
-    dfs_grouped = []
+    # the peak labels are positions in df_end, every peak starts a new chunk
+    first_is_hill = None
     if len(hills) != 0 and len(valleys) != 0:
-        if hills.values.flat[0] < valleys.values.flat[0]:
-            for i in range(1, len(dfs_chunks), 2):
-                dfs_grouped.append([dfs_chunks[i - 1], dfs_chunks[i]])
-            if len(dfs_chunks) % 2 != 0:
-                dfs_grouped.append([dfs_chunks[-1]])
-        else:
-            dfs_grouped = [[dfs_chunks[0]]]
-            for i in range(2, len(dfs_chunks), 2):
-                dfs_grouped.append([dfs_chunks[i - 1], dfs_chunks[i]])
-            if len(dfs_chunks) % 2 == 0:
-                dfs_grouped.append([dfs_chunks[-1]])
+        first_is_hill = bool(hills.values.flat[0] < valleys.values.flat[0])
+
+    columns = {name: df_end[name].values for name in df_end.columns}
+    cycles = CycleTable.from_peaks(columns, df_min_max.index.values, len(df_end), first_is_hill, frame=df_end)
 
     logger.info(f'Sections grouped')
-    return dfs_chunks, dfs_grouped
+    return cycles
+
+
+class CycleTable:
+    # struct-of-arrays index of the half-cycles (chunks) between consecutive peaks. Chunk n covers the rows
+    # [start[n], stop[n]) of the shared column buffers, halves[c] holds the chunk numbers of the first and second half
+    # of cycle c, -1 where a half is missing. Nothing is copied, chunks are only sliced out on request
+    def __init__(self, columns, start, stop, halves, frame=None):
+        self.columns = columns
+        self.frame = frame
+        self.start = start
+        self.stop = stop
+        self.halves = halves
+
+        # per chunk: 1-based cycle number (0 = not part of a cycle), position in the cycle and strain direction
+        self.cycle = np.zeros(len(start), dtype=np.int64)
+        self.down = np.full(len(start), -1, dtype=np.int64)
+        for down in range(2):
+            valid = halves[:, down] >= 0
+            self.cycle[halves[valid, down]] = np.flatnonzero(valid) + 1
+            self.down[halves[valid, down]] = down
+
+        travel = columns['Standard travel']
+        filled = stop > start
+        self.direction = np.zeros(len(start), dtype=np.int64)
+        self.direction[filled] = np.sign(travel[stop[filled] - 1] - travel[start[filled]])
+
+    @classmethod
+    def from_peaks(cls, columns, peaks, n_end, first_is_hill, frame=None):
+        borders = np.concatenate([[0], peaks, [n_end]]).astype(np.int64)
+        start, stop = borders[:-1], borders[1:]
+        n_chunks = len(start)
+
+        # starting on a hill pairs the chunks (0, 1), (2, 3), ..., starting in a valley leaves chunk 0 on its own
+        if first_is_hill is None:
+            firsts = np.empty(0, dtype=np.int64)
+        elif first_is_hill:
+            firsts = np.arange(0, n_chunks, 2)
+        else:
+            firsts = np.concatenate([[0], np.arange(1, n_chunks, 2)]).astype(np.int64)
+
+        # a leading valley leaves chunk 0 without a second half, numpy booleans count as well
+        seconds = firsts + 1
+        seconds[seconds >= n_chunks] = -1
+        if first_is_hill is not None and not first_is_hill:
+            seconds[0] = -1
+
+        return cls(columns, start, stop, np.stack([firsts, seconds], axis=1), frame=frame)
+
+    def __len__(self):
+        return len(self.halves)
+
+    @property
+    def lengths(self):
+        return self.stop - self.start
+
+    def chunk(self, n):
+        start, stop = self.start[n], self.stop[n]
+        if self.frame is not None:
+            return self.frame.iloc[start:stop]
+        return pd.DataFrame({name: np.asarray(column[start:stop]) for name, column in self.columns.items()},
+                            index=pd.RangeIndex(start, stop))
+
+    def label(self, position):
+        # index label of a row of the shared buffers, rows without a frame are labelled by their position
+        if self.frame is not None:
+            return self.frame.index[position]
+        return position
+
+    def group(self, c):
+        return [self.chunk(n) for n in self.halves[c] if n >= 0]
+
+    def complete(self):
+        # cycles with both halves
+        return np.flatnonzero((self.halves >= 0).all(axis=1))
+
+    def drop_connectors(self, max_difference=10):
+        # the second half of a cycle is dropped if its length differs too much from the first one
+        halves = self.halves.copy()
+        both = (halves >= 0).all(axis=1)
+        lengths = self.lengths
+        connector = both & (np.abs(lengths[halves[:, 0]] - lengths[np.where(both, halves[:, 1], 0)]) > max_difference)
+        halves[connector, 1] = -1
+        return CycleTable(self.columns, self.start, self.stop, halves, frame=self.frame)
+
+    def to_frame(self):
+        return pd.DataFrame({'start': self.start, 'stop': self.stop, 'cycle': self.cycle,
+                             'down': self.down, 'direction': self.direction})
+
+
+def get_master_curves(df, hills, valleys, log=False):
+    logger.info(f'Called get_master_curves')
+
+    # calculation
+    df_time_strain = df[df.index.isin(valleys.values)]
+    df_strain_stress = df[df.index.isin(hills.values)]
+    d = {'time_strain': df_time_strain, 'strain_stress': df_strain_stress}
 
+    if log:
+        logger.info(f'{len(df_time_strain)} valleys and {len(df_strain_stress)} hills collected')
+
+    logger.info(f'Calculated master curves')
+    return d
 
-def get_master_curves(df, hills, valleys, figsize=(20, 10), log=False):
-    logger.info(f'Called get_master_curves')
+
+def plot_master_curves(d, figsize=(20, 10), log=False, max_points=None, decimation='LTTB'):
+    logger.info(f'Called plot_master_curves')
+    import matplotlib.pyplot as plt
 
     # init
     fig = plt.figure(figsize=figsize)
     axs = fig.subplots(2, 1)
     fig.suptitle('Master curves across all cycles')
 
-    # calculation
-    df_time_strain = df[df.index.isin(valleys.values)]
-    df_strain_stress = df[df.index.isin(hills.values)]
-    d = {'time_strain': df_time_strain, 'strain_stress': df_strain_stress}
+    df_time_strain, df_strain_stress = d['time_strain'], d['strain_stress']
 
     # plotting
-    axs[0].plot([i for i in range(1, len(df_time_strain)+1)],
-                df_time_strain['Standard travel'], color='lightgreen')
-    axs[0].scatter([i for i in range(1, len(df_time_strain)+1)],
-                   df_time_strain['Standard travel'],
-                   color='forestgreen')
+    downsample.plot(axs[0], np.arange(1, len(df_time_strain) + 1),
+                    df_time_strain['Standard travel'], max_points, decimation, color='lightgreen')
+    downsample.scatter(axs[0], np.arange(1, len(df_time_strain) + 1),
+                       df_time_strain['Standard travel'], max_points, decimation,
+                       color='forestgreen')
     axs[0].set_xlabel('Cycle number')
     axs[0].set_ylabel('Strain [%]')
 
     if log:
         logger.info('First graph plotted successfully')
 
-    axs[1].plot(df_strain_stress['Standard travel'],
-                df_strain_stress['Standard stress'], color='tan')
-    axs[1].scatter(df_strain_stress['Standard travel'],
-                   df_strain_stress['Standard stress'],
-                   color='darkorange')
+    downsample.plot(axs[1], df_strain_stress['Standard travel'],
+                    df_strain_stress['Standard stress'], max_points, decimation, color='tan')
+    downsample.scatter(axs[1], df_strain_stress['Standard travel'],
+                       df_strain_stress['Standard stress'], max_points, decimation,
+                       color='darkorange')
     axs[1].set_xlabel('Strain [%]')
     axs[1].set_ylabel('Stress [MPa]')
 
     if log:
         logger.info('Second graph plotted successfully')
 
-    logger.info(f'Calculated master curves')
-    return d, fig
+    return fig
@@ -0,0 +1,123 @@
+import logging
+import math
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class RainflowCounter:
+    # ASTM E1049 rainflow counting in a single streaming pass. Values can be pushed in any number of batches (e.g. the
+    # turning points of preprocessing.detect_peaks or the batches of io_data.TailReader). Only the reversals whose
+    # ranges are still open stay on the stack, closed cycles go straight into a histogram of (range, mean) bins, so the
+    # memory does not grow with the number of reversals
+    def __init__(self, bin_width):
+        self.bin_width = bin_width
+        self.histogram = {}
+        self.stack = []
+        self.last = None
+        self.candidate = None
+        self.n_reversals = 0
+
+    def push(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        # the first value ever is the starting point of the count
+        if self.last is None:
+            self.confirm(float(values[0]))
+            values = values[1:]
+
+        # reversals are the points where the direction changes, the last point stays a candidate until a later value
+        # shows whether the direction changes there
+        points = np.concatenate([[self.last], [] if self.candidate is None else [self.candidate], values])
+        points = points[np.concatenate([[True], np.diff(points) != 0])]
+        if len(points) < 2:
+            return
+        signs = np.sign(np.diff(points))
+        for value in points[1:-1][signs[1:] != signs[:-1]].tolist():
+            self.confirm(value)
+        self.candidate = float(points[-1])
+
+    def confirm(self, value):
+        self.last = value
+        self.n_reversals += 1
+        self.stack.append(value)
+        for value_range, value_mean, count in self.close(self.stack):
+            self.add(self.histogram, value_range, value_mean, count)
+
+    def close(self, stack):
+        # X is the most recent range, Y the one before. Y is closed once X is at least as large
+        closed = []
+        while len(stack) >= 3:
+            x = abs(stack[-1] - stack[-2])
+            y = abs(stack[-2] - stack[-3])
+            if x < y:
+                break
+            if len(stack) == 3:
+                # Y contains the starting point: half a cycle, the starting point moves on
+                closed.append((y, (stack[0] + stack[1]) / 2, 0.5))
+                stack.pop(0)
+            else:
+                closed.append((y, (stack[-2] + stack[-3]) / 2, 1.0))
+                del stack[-3:-1]
+        return closed
+
+    def add(self, histogram, value_range, value_mean, count):
+        key = (int(math.floor(value_range / self.bin_width)), int(math.floor(value_mean / self.bin_width)))
+        histogram[key] = histogram.get(key, 0.0) + count
+
+    def residue(self):
+        # the pending candidate is the last reversal of the history counted so far, it closes ranges like any other
+        # reversal, on a copy of the stack so that counting can go on. The ranges left open count as half a cycle each
+        stack = list(self.stack)
+        closed = []
+        if self.candidate is not None:
+            stack.append(self.candidate)
+            closed = self.close(stack)
+        return closed + [(abs(b - a), (a + b) / 2, 0.5) for a, b in zip(stack[:-1], stack[1:])]
+
+    def to_frame(self, with_residue=True):
+        # counted cycles per bin, range and mean are given as bin centers. Counting can go on afterwards
+        histogram = dict(self.histogram)
+        if with_residue:
+            for value_range, value_mean, count in self.residue():
+                self.add(histogram, value_range, value_mean, count)
+
+        keys = sorted(histogram)
+        bins = np.array(keys, dtype=np.float64).reshape(-1, 2)
+        return pd.DataFrame({'range': (bins[:, 0] + 0.5) * self.bin_width,
+                             'mean': (bins[:, 1] + 0.5) * self.bin_width,
+                             'cycles': [histogram[key] for key in keys]})
+
+
+def count(values, bin_width):
+    counter = RainflowCounter(bin_width)
+    counter.push(values)
+    return counter
+
+
+def calc(df, d, strain_bin_width=0.005, stress_bin_width=1.0, log=False):
+    logger.info(f'Called calc with bin widths: {strain_bin_width} (strain), {stress_bin_width} (stress)')
+
+    # turning points are the detected hills and valleys, pre-loading included, plus the start and end of the test.
+    # df can also be a dict of columns, e.g. memory-mapped ones cut to the end of the test, only the turning points
+    # are read
+    n_rows = len(df['Standard travel'])
+    peaks = [d['hills'], d['valleys']] + list(d['preloading'].values())
+    positions = np.concatenate([np.asarray(values) for values in peaks] + [[0, n_rows - 1]])
+    positions = np.unique(positions.astype(np.int64))
+    positions = positions[(positions >= 0) & (positions < n_rows)]
+
+    results = {}
+    for name, column, bin_width in [('strain', 'Standard travel', strain_bin_width),
+                                    ('stress', 'Standard stress', stress_bin_width)]:
+        counter = count(np.asarray(df[column])[positions], bin_width)
+        results[name] = counter.to_frame()
+        if log:
+            logger.info(f'{name}: {counter.n_reversals} reversals, {results[name]["cycles"].sum()} cycles')
+
+    logger.info(f'Successfully counted rainflow cycles at {len(positions)} turning points')
+    return results
@@ -0,0 +1,153 @@
+import argparse
+import concurrent.futures
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+import time
+
+# extend PYTHONPATH to access local files without packaging a module
+sys.path.extend([os.getcwd()])
+
+from src import analysis_settings, filters, pipeline, preprocessing
+
+logger = logging.getLogger(__name__)
+
+# default grid, 100 combinations around the default settings
+SMOOTHINGS = [5, 10, 15, 20, 25]
+DISTANCES = [5, 10, 20, 50]
+WIDTHS = [5, 10, 20, 50, 100]
+
+
+def sweep(df, smoothings=SMOOTHINGS, distances=DISTANCES, widths=WIDTHS, smoothing_method='Moving average',
+          workers=None):
+    logger.info(f'Called sweep with {len(smoothings) * len(distances) * len(widths)} combinations')
+
+    # one task per smoothing value, the smoothed signal and the peak properties are shared by all distances and
+    # widths. scipy's peak kernels release the GIL, so threads suffice
+    travel = df['Standard travel'].values
+    if workers == 1:
+        rows = [row for smoothing in smoothings
+                for row in sweep_smoothing(travel, smoothing, distances, widths, smoothing_method)]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(sweep_smoothing, travel, smoothing, distances, widths, smoothing_method)
+                       for smoothing in smoothings]
+            rows = [row for future in futures for row in future.result()]
+
+    results = pd.DataFrame(rows, columns=['smoothing', 'distance', 'width', 'hills', 'valleys', 'cycles',
+                                          'complete_cycles', 'alternation_errors', 'period_cv', 'range_cv'])
+
+    logger.info(f'Swept {len(results)} combinations')
+    return results
+
+
+def sweep_smoothing(travel, smoothing, distances, widths, smoothing_method='Moving average'):
+    # detect_peaks for every distance and width at one smoothing value, identical to find_peaks(distance, width)
+    import scipy.signal as signal
+
+    smooth = filters.smooth(travel, smoothing, smoothing_method)
+    signs = [smooth, np.negative(smooth)]
+    properties = [peak_properties(values) for values in signs]
+
+    rows = []
+    for distance in distances:
+        # the distance selection depends on the other peaks, it runs once per distance and sign
+        selected = []
+        for values, (maxima, maxima_widths) in zip(signs, properties):
+            peaks, null = signal.find_peaks(values, distance=distance)
+            selected.append((peaks, maxima_widths[np.searchsorted(maxima, peaks)]))
+
+        for width in widths:
+            (hills, hill_widths), (valleys, valley_widths) = selected
+            row = {'smoothing': smoothing, 'distance': distance, 'width': width}
+            row.update(metrics(travel, hills[hill_widths >= width], valleys[valley_widths >= width]))
+            rows.append(row)
+
+    return rows
+
+
+def peak_properties(values):
+    # prominence and width of a peak only depend on the signal, not on the other peaks. They are computed once for
+    # all local maxima like find_peaks does for its width filter (wlen None, half the prominence)
+    import scipy.signal as signal
+
+    maxima, null = signal.find_peaks(values)
+    prominences = signal.peak_prominences(values, maxima)
+    widths = signal.peak_widths(values, maxima, rel_height=0.5, prominence_data=prominences)[0]
+    return maxima, widths
+
+
+def metrics(travel, hills, valleys):
+    # cycle counts as in preprocessing.groupify and the regularity of the detected peaks: peaks of the same kind
+    # following each other, coefficients of variation of the hill spacing and of the strain range between peaks
+    peaks = np.concatenate([hills, valleys])
+    order = np.argsort(peaks, kind='stable')
+    peaks, is_hill = peaks[order], (np.arange(len(peaks)) < len(hills))[order]
+
+    first_is_hill = bool(hills[0] < valleys[0]) if len(hills) and len(valleys) else None
+    cycles = preprocessing.CycleTable.from_peaks({'Standard travel': travel}, peaks, len(travel), first_is_hill)
+
+    periods = np.diff(hills)
+    ranges = np.abs(np.diff(travel[peaks]))
+    return {'hills': len(hills), 'valleys': len(valleys), 'cycles': len(cycles),
+            'complete_cycles': len(cycles.complete()),
+            'alternation_errors': int(np.count_nonzero(is_hill[1:] == is_hill[:-1])),
+            'period_cv': variation(periods), 'range_cv': variation(ranges)}
+
+
+def variation(values):
+    if len(values) < 2 or np.mean(values) == 0:
+        return np.nan
+    return float(np.std(values) / np.mean(values))
+
+
+def run(path_to_file, values, smoothings=SMOOTHINGS, distances=DISTANCES, widths=WIDTHS, workers=None):
+    logger.info(f'Called run for {path_to_file}')
+
+    # loading, stress and cut_end like in the GUI, the sweep replaces detect_peaks
+    df = pipeline.Pipeline(path_to_file).run('cut_end', values)
+    if df.empty:
+        raise ValueError('Please check input file formatting')
+    return sweep(df, smoothings, distances, widths, values['smoothing_method'], workers)
+
+
+def parse_grid(text):
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a grid of peak detection parameters for one specimen.')
+    parser.add_argument('input', help='cyclic test file')
+    parser.add_argument('-s', '--settings', default=None,
+                        help='ctanalyzer.ini or a json file with the keys of the GUI settings')
+    parser.add_argument('--smoothing', type=parse_grid, default=SMOOTHINGS,
+                        help='comma separated smoothing windows, default: %(default)s')
+    parser.add_argument('--distance', type=parse_grid, default=DISTANCES,
+                        help='comma separated peak distances, default: %(default)s')
+    parser.add_argument('--width', type=parse_grid, default=WIDTHS,
+                        help='comma separated peak widths, default: %(default)s')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker threads, defaults to the number of CPUs')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every step')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO if args.verbose else logging.WARNING)
+
+    values = analysis_settings.read(args.settings)
+    start = time.time()
+    results = run(args.input, values, args.smoothing, args.distance, args.width, workers=args.workers)
+
+    if args.output is not None:
+        results.to_csv(args.output, sep='\t', index=False)
+
+    print(results.to_string(index=False))
+    print(f'{len(results)} combinations in {time.time() - start:.2f} s')
+    return 0
+
+
+# prohibit execution on import
+if __name__ == '__main__':
+    sys.exit(main())